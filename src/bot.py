@@ -4,32 +4,41 @@ Provides remote control interface for AI CLI tools via Telegram.
 """
 
 import asyncio
+import contextvars
 import logging
-import uuid
+import random
+import re
+import secrets
+import shutil
+import time
+from io import BytesIO
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, FrozenSet, Optional, Set, Tuple
 
+import aiofiles
+import aiohttp
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ChatAction, ParseMode
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
-    ContextTypes,
+    Defaults,
     ContextTypes,
     filters
 )
 from telegram.request import HTTPXRequest
-from telegram.error import TimedOut
+from telegram.error import RetryAfter, TimedOut
 
 from .utils import (
     setup_logging,
     load_environment,
     validate_file_type,
-    sanitize_message,
     format_file_size,
-    ensure_directory,
-    escape_markdown
+    escape_markdown,
+    LRUCache
 )
 from .session_manager import SessionManager
 from .orchestrator import Orchestrator
@@ -38,6 +47,143 @@ from .directory_browser import DirectoryBrowser
 
 logger = logging.getLogger(__name__)
 
+# Chat of the /code run executing in the current task. /code runs overlap, so
+# permission prompts must go to the chat of the run that raised them
+_current_chat_id: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+    "current_chat_id", default=None
+)
+
+
+_WELCOME_MSG = (
+    "🤖 **Welcome to AgenticGram!**\n\n"
+    "I'm your AI coding assistant bridge. I can execute commands via Claude Code CLI "
+    "or fallback to OpenRouter when needed.\n\n"
+    "**Available Commands:**\n"
+    "/code <instruction> - Execute an AI coding instruction\n"
+    "/browse - Browse and select working directory\n"
+    "/session - Manage your session (new/clear/info)\n"
+    "/status - Check backend availability\n"
+    "/help - Show this help message\n\n"
+    "You can also send me code files (.py, .sql, .js) and I'll save them to your workspace!"
+)
+
+_HELP_MSG = (
+    "📚 **AgenticGram Help**\n\n"
+    "**Commands:**\n"
+    "• `/code <instruction>` - Execute coding instruction\n"
+    "  Example: `/code Create a Python function to calculate fibonacci`\n\n"
+    "• `/browse [path]` - Browse and select working directory\n"
+    "  Navigate through directories with inline buttons\n\n"
+    "• `/trust [directory]` - Trust a directory for Claude CLI\n"
+    "  Prevents permission prompts for the specified directory\n"
+    "  If no directory specified, trusts current work directory\n\n"
+    "• `/session new` - Start a new session\n"
+    "• `/session clear` - Clear current session\n"
+    "• `/session info` - Show session information\n\n"
+    "• `/status` - Check AI backend availability\n\n"
+    "**File Uploads:**\n"
+    "Send me code files and I'll save them to your workspace.\n"
+    "Supported: .py, .sql, .js, .txt, .json, .md\n\n"
+    "**Permission System:**\n"
+    "Claude uses `--dangerously-skip-permissions` to avoid deadlocks. "
+    "Use `/trust <directory>` to manually trust directories if needed."
+)
+
+_CODE_USAGE_MSG = (
+    "❌ Please provide an instruction.\n"
+    "Usage: `/code <your instruction>`"
+)
+
+_CODE_BUSY_MSG = "⏳ A /code command is already running for you. Please wait for it to finish."
+_CODE_WAITING_MSG = "🤖 **Claude is working...**\n\n_Waiting for response..._"
+
+_SESSION_USAGE_MSG = (
+    "Usage:\n"
+    "/session new - Create new session\n"
+    "/session clear - Clear current session\n"
+    "/session info - Show session info"
+)
+
+_TRUST_USAGE_MSG = (
+    "❌ No directory specified and no active session.\n\n"
+    "Usage: `/trust <directory_path>`\n"
+    "Example: `/trust /home/tony/projects`"
+)
+
+_UNSUPPORTED_FILE_MSG = "❌ Unsupported file type. Allowed: .py, .sql, .js, .txt, .json, .md"
+
+_PERMISSION_TIMEOUT_MSG = "⏱️ Permission request timed out. Denied by default."
+
+# Permission prompt per action type: (message template, fallback target).
+# A fallback of None means the template shows the description instead of the target
+_PERMISSION_PROMPTS = {
+    "menu_prompt": ("🔐 **Claude is asking:**\n\n{}\n\n**Please select an option:**", None),
+    "interactive_prompt": ("🔐 **Claude is asking:**\n\n{}\n\n**Please respond:**", None),
+    "directory_access": (
+        "🔐 **Permission Required**\n\nClaude wants to access:\n`{}`\n\n**Allow access?**",
+        "unknown directory"
+    ),
+    "file_edit": (
+        "🔐 **Permission Required**\n\nClaude wants to edit:\n`{}`\n\n**Allow this action?**",
+        "unknown file"
+    ),
+    "command_exec": (
+        "🔐 **Permission Required**\n\nClaude wants to run:\n`{}`\n\n**Allow this command?**",
+        "unknown command"
+    ),
+}
+_PERMISSION_PROMPT_DEFAULT = "🔐 **Permission Required**\n\n{}\n\n**Approve?**"
+
+# Permission callback actions answering a yes/no prompt (anything else is a menu option)
+_YES_NO_ACTIONS = frozenset({"yes", "no"})
+
+# Claude's "thinking" spinner frames, and whole lines consisting of one
+_SPINNER_CHARS = frozenset("✢*✶✻✽·●")
+_SPINNER_LINE_RE = re.compile(r'^\s*[✢*✶✻✽·●]\s*$', re.MULTILINE)
+
+# Characters of streamed /code output shown in the live status message
+_STREAM_PREVIEW_CHARS = 3500
+
+# Uploads are streamed to disk in chunks of this size
+_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+_YES_LABEL = "✅ Yes"
+_NO_LABEL = "❌ No"
+
+
+def _yes_no_markup(request_id: str) -> InlineKeyboardMarkup:
+    """Build the Yes/No keyboard for a permission request."""
+    return InlineKeyboardMarkup((
+        (
+            InlineKeyboardButton(_YES_LABEL, callback_data=f"perm_{request_id}_yes"),
+            InlineKeyboardButton(_NO_LABEL, callback_data=f"perm_{request_id}_no"),
+        ),
+    ))
+
+
+def _lower(text: str) -> str:
+    """Lowercase a command argument, reusing it when it is already lowercase."""
+    return text if text.islower() else text.lower()
+
+
+def _is_unmodified_save(path: Path, size: int, mtime_ns: int) -> bool:
+    """
+    Check whether a saved upload is still exactly as it was written.
+
+    Args:
+        path: Where the upload was saved
+        size: File size right after saving
+        mtime_ns: Modification time (ns) right after saving
+
+    Returns:
+        True if the file exists with the same size and modification time
+    """
+    try:
+        stat = path.stat()
+    except OSError:
+        return False
+    return stat.st_size == size and stat.st_mtime_ns == mtime_ns
+
 
 class AgenticGramBot:
     """Main bot class for AgenticGram."""
@@ -50,7 +196,7 @@ class AgenticGramBot:
             config: Configuration dictionary from environment
         """
         self.config = config
-        self.allowed_users = set(config["ALLOWED_TELEGRAM_IDS"])
+        self.allowed_users: FrozenSet[int] = frozenset(config["ALLOWED_TELEGRAM_IDS"])
         self.permission_timeout = config["PERMISSION_TIMEOUT_MINUTES"] * 60  # Convert to seconds
         
         # Initialize components
@@ -66,8 +212,12 @@ class AgenticGramBot:
         # Set permission callback
         self.orchestrator.set_permission_callback(self._handle_permission_request)
         
-        # Track pending permission requests
-        self.pending_permissions: Dict[str, asyncio.Future] = {}
+        # Track pending permission requests, bounded so abandoned requests
+        # can't pile up; evicted requests are denied
+        self.pending_permissions: Dict[str, asyncio.Future] = LRUCache(
+            maxsize=1024,
+            on_evict=self._deny_evicted_permission
+        )
         
         # Initialize directory browser
         self.directory_browser = DirectoryBrowser(
@@ -77,31 +227,75 @@ class AgenticGramBot:
             max_dirs_per_page=config["MAX_DIRS_PER_PAGE"]
         )
         
-        # Track user navigation state (current_path per user)
-        self.user_navigation: Dict[int, str] = {}
+        # Track user navigation state (current_path per user), bounded so
+        # abandoned /browse sessions don't accumulate
+        self.user_navigation: Dict[int, str] = LRUCache(maxsize=1024)
+        
+        # Directories already trusted via `claude trust` during this run
+        self._trusted_dirs: Set[Path] = set()
+        
+        # Users with a /code run in progress
+        self._active_code_users: Set[int] = set()
+        
+        # Strong references to fire-and-forget tasks so they aren't GC'd mid-flight
+        self._background_tasks: Set[asyncio.Task] = set()
+        
+        # Where each user's uploaded file (by Telegram file_unique_id) was last
+        # saved, with its size and mtime then, so re-uploads of an unmodified
+        # save can be copied locally instead of downloaded again
+        self._uploaded_files: Dict[Tuple[int, str], Tuple[Path, int, int]] = LRUCache(maxsize=128)
+        
+        # /session sub-command dispatch table
+        self._session_actions = {
+            "new": self._session_new,
+            "clear": self._session_clear,
+            "info": self._session_info,
+        }
         
         # Database/State initialization would go here
         
-        # Configure request timeouts
+        # Configure request timeouts. Permission prompts, stream edits and
+        # replies from concurrent handlers all share this connection pool
         request = HTTPXRequest(
+            connection_pool_size=8,
             connect_timeout=20.0,
             read_timeout=20.0,
             write_timeout=20.0,
             pool_timeout=20.0,
         )
         
-        # Build application
-        self.app = Application.builder().token(config["TELEGRAM_BOT_TOKEN"]).request(request).build()
+        # Throttle outgoing calls to Telegram's flood limits (30 msg/s overall,
+        # 20 msg/min per group) instead of running into 429 errors
+        rate_limiter = AIORateLimiter(
+            overall_max_rate=30,
+            overall_time_period=1,
+            group_max_rate=20,
+            group_time_period=60,
+            max_retries=3
+        )
+        
+        # Build application; replies are Markdown unless a call opts out
+        # with parse_mode=None (used for text that embeds raw error messages)
+        self.app = (
+            Application.builder()
+            .token(config["TELEGRAM_BOT_TOKEN"])
+            .request(request)
+            .rate_limiter(rate_limiter)
+            .defaults(Defaults(parse_mode=ParseMode.MARKDOWN))
+            .build()
+        )
         self._register_handlers()
     
     def _register_handlers(self) -> None:
         """Register command and message handlers."""
         # Command handlers
+        # Slow handlers are non-blocking so they don't stall other updates
+        # (including the permission buttons a running /code waits on)
         self.app.add_handler(CommandHandler("start", self._cmd_start))
         self.app.add_handler(CommandHandler("help", self._cmd_help))
-        self.app.add_handler(CommandHandler("code", self._cmd_code))
+        self.app.add_handler(CommandHandler("code", self._cmd_code, block=False))
         self.app.add_handler(CommandHandler("session", self._cmd_session))
-        self.app.add_handler(CommandHandler("status", self._cmd_status))
+        self.app.add_handler(CommandHandler("status", self._cmd_status, block=False))
         self.app.add_handler(CommandHandler("browse", self._cmd_browse))
         self.app.add_handler(CommandHandler("trust", self._cmd_trust))
         
@@ -125,30 +319,53 @@ class AgenticGramBot:
         """
         return user_id in self.allowed_users
     
+    def _send_typing(self, update: Update) -> None:
+        """
+        Show the typing indicator without waiting for Telegram to acknowledge it.
+        
+        Args:
+            update: Update whose chat should show the indicator
+        """
+        self._spawn(update.effective_chat.send_action(ChatAction.TYPING))
+    
+    def _spawn(self, coro) -> asyncio.Task:
+        """
+        Run a coroutine as a background task, keeping a reference until it finishes.
+        
+        Args:
+            coro: Coroutine to run
+            
+        Returns:
+            The scheduled task
+        """
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_task_done)
+        return task
+    
+    def _on_background_task_done(self, task: asyncio.Task) -> None:
+        """Drop a finished background task, logging any failure it raised."""
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.debug("Background task failed: %s", task.exception())
+    
+    def _deny_evicted_permission(self, request_id: str, future: asyncio.Future) -> None:
+        """Deny a permission request dropped from the pending cache."""
+        if not future.done():
+            future.set_result(False)
+        logger.warning("Permission request %s evicted from pending cache, denied", request_id)
+    
     async def _cmd_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /start command."""
         user_id = update.effective_user.id
         
         if not self._check_authorization(user_id):
             await update.message.reply_text("❌ Unauthorized. Contact the bot administrator.")
-            logger.warning(f"Unauthorized access attempt from user {user_id}")
+            logger.warning("Unauthorized access attempt from user %s", user_id)
             return
         
-        welcome_message = (
-            "🤖 **Welcome to AgenticGram!**\n\n"
-            "I'm your AI coding assistant bridge. I can execute commands via Claude Code CLI "
-            "or fallback to OpenRouter when needed.\n\n"
-            "**Available Commands:**\n"
-            "/code <instruction> - Execute an AI coding instruction\n"
-            "/browse - Browse and select working directory\n"
-            "/session - Manage your session (new/clear/info)\n"
-            "/status - Check backend availability\n"
-            "/help - Show this help message\n\n"
-            "You can also send me code files (.py, .sql, .js) and I'll save them to your workspace!"
-        )
-        
-        await update.message.reply_text(welcome_message, parse_mode="Markdown")
-        logger.info(f"User {user_id} started the bot")
+        await update.message.reply_text(_WELCOME_MSG)
+        logger.info("User %s started the bot", user_id)
     
     async def _cmd_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /help command."""
@@ -158,105 +375,71 @@ class AgenticGramBot:
             await update.message.reply_text("❌ Unauthorized.")
             return
         
-        help_message = (
-            "📚 **AgenticGram Help**\n\n"
-            "**Commands:**\n"
-            "• `/code <instruction>` - Execute coding instruction\n"
-            "  Example: `/code Create a Python function to calculate fibonacci`\n\n"
-            "• `/browse [path]` - Browse and select working directory\n"
-            "  Navigate through directories with inline buttons\n\n"
-            "• `/trust [directory]` - Trust a directory for Claude CLI\n"
-            "  Prevents permission prompts for the specified directory\n"
-            "  If no directory specified, trusts current work directory\n\n"
-            "• `/session new` - Start a new session\n"
-            "• `/session clear` - Clear current session\n"
-            "• `/session info` - Show session information\n\n"
-            "• `/status` - Check AI backend availability\n\n"
-            "**File Uploads:**\n"
-            "Send me code files and I'll save them to your workspace.\n"
-            "Supported: .py, .sql, .js, .txt, .json, .md\n\n"
-            "**Permission System:**\n"
-            "Claude uses `--dangerously-skip-permissions` to avoid deadlocks. "
-            "Use `/trust <directory>` to manually trust directories if needed."
-        )
-        
-        await update.message.reply_text(help_message, parse_mode="Markdown")
+        await update.message.reply_text(_HELP_MSG)
     
     async def _cmd_code(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /code command."""
         user_id = update.effective_user.id
+        reply = update.message.reply_text
         chat_id = update.effective_chat.id
         
         if not self._check_authorization(user_id):
-            await update.message.reply_text("❌ Unauthorized.")
+            await reply("❌ Unauthorized.")
             return
         
         # Get instruction from command arguments
         if not context.args:
-            await update.message.reply_text(
-                "❌ Please provide an instruction.\n"
-                "Usage: `/code <your instruction>`",
-                parse_mode="Markdown"
-            )
+            await reply(_CODE_USAGE_MSG)
             return
         
         instruction = " ".join(context.args)
         
+        # One run per user at a time: concurrent runs would share the workspace
+        if user_id in self._active_code_users:
+            await reply(_CODE_BUSY_MSG)
+            return
+        self._active_code_users.add(user_id)
+        
         # Send typing indicator
-        await update.message.chat.send_action("typing")
+        self._send_typing(update)
         
-        # Set current chat_id for permission requests
-        self.current_chat_id = update.effective_chat.id
+        # Set this run's chat_id for its permission requests (the handler runs
+        # in its own task, so this doesn't leak into other users' runs)
+        _current_chat_id.set(chat_id)
         
-        # Send initial status message
-        status_message = await update.message.reply_text(
-            "🤖 **Claude is working...**\n\n_Waiting for response..._",
-            parse_mode="Markdown"
-        )
+        # Send initial status message without holding up command startup;
+        # everything that edits it awaits the task first
+        status_task = asyncio.create_task(reply(_CODE_WAITING_MSG))
         
         # Execute command
-        logger.info(f"Executing code command for user {user_id}: {instruction[:50]}...")
-        
-        # Track streaming state
-        last_output = ""
-        last_edit_time = 0
-        update_count = 0
-        EDIT_COOLDOWN = 0.5  # Minimum 0.5 seconds between edits for responsive updates
-        
-        # Initialize thinking state
-        self.thinking_msg_id = None
-        self.last_thinking_time = 0
-        self.Thinking_chars = set("✢*✶✻✽·●")
-        
-        async def stream_callback(output: str):
-            nonlocal last_output, last_edit_time, update_count
+        logger.info("Executing code command for user %s: %s...", user_id, instruction[:50])
+        
+        # Track streaming state: edits are debounced so at most one status edit
+        # happens per EDIT_COOLDOWN, always showing the latest output
+        latest_output = ""
+        stream_tail = ""  # End of the finished output, all the preview can show
+        stream_truncated = False
+        next_edit_time = 0.0
+        flush_task = None
+        EDIT_COOLDOWN = 1.0  # Telegram allows roughly one edit per second per chat
+        
+        async def render_stream(output: str):
+            nonlocal next_edit_time
             
-            if not output:
-                return
-
             try:
+                # Only the end of the output fits in the message, so clean and
+                # escape just a tail of it (with headroom for removed spinner lines)
+                tail = output[-2 * _STREAM_PREVIEW_CHARS:]
+                truncated = stream_truncated or len(tail) < len(output)
+                
                 # 1. Clean output body (remove the "infinite spaces" and spinner history)
                 # Remove lines that look like they are just spinner characters
                 # This keeps the main text clean
-                clean_body = re.sub(
-                    r'^\s*[✢*✶✻✽·●]\s*$', 
-                    '', 
-                    output, 
-                    flags=re.MULTILINE
-                )
+                clean_body = _SPINNER_LINE_RE.sub('', tail)
                 
                 # Check if we are currently in "Thinking" state (end of stream is a spinner)
-                raw_tail = output.strip().split('\n')[-1].strip() if output.strip() else ""
-                is_thinking = len(raw_tail) == 1 and raw_tail in self.Thinking_chars
-                
-                # Rate limiting
-                import time
-                current_time = time.time()
-                if current_time - last_edit_time < EDIT_COOLDOWN:
-                     return
-
-                update_count += 1
-                last_edit_time = current_time
+                raw_tail = tail.strip().rpartition('\n')[2].strip()
+                is_thinking = len(raw_tail) == 1 and raw_tail in _SPINNER_CHARS
                 
                 # Format the message
                 escaped_body = escape_markdown(clean_body.strip())
@@ -269,36 +452,80 @@ class AgenticGramBot:
                     else:
                         # Show content + thinking status
                         # Truncate content if needed
-                        if len(escaped_body) > 3500:
-                            escaped_body = "...[truncated]\n\n" + escaped_body[-3500:]
+                        if truncated or len(escaped_body) > _STREAM_PREVIEW_CHARS:
+                            escaped_body = "...[truncated]\n\n" + escaped_body[-_STREAM_PREVIEW_CHARS:]
                         formatted = f"🤖 **Claude is working...**\n\n```\n{escaped_body}\n```\n\n_Thinking {spinner}_"
                 else:
                     # Just content
                     if not escaped_body:
                         formatted = "🤖 **Claude is working...**"
                     else:
-                        if len(escaped_body) > 3500:
-                            escaped_body = "...[truncated]\n\n" + escaped_body[-3500:]
+                        if truncated or len(escaped_body) > _STREAM_PREVIEW_CHARS:
+                            escaped_body = "...[truncated]\n\n" + escaped_body[-_STREAM_PREVIEW_CHARS:]
                         formatted = f"🤖 **Claude is working...**\n\n```\n{escaped_body}\n```"
                 
                 try:
+                    status_message = await status_task
                     await status_message.edit_text(
-                        formatted,
-                        parse_mode="Markdown"
+                        formatted
                     )
+                except RetryAfter as e:
+                    # Flood control: hold further edits until Telegram allows them again
+                    next_edit_time = time.monotonic() + e.retry_after
                 except Exception as e:
-                    logger.debug(f"Message edit failed: {e}")
+                    logger.debug("Message edit failed: %s", e)
             
             except Exception as e:
-                logger.error(f"Error in stream callback: {e}")
+                logger.error("Error in stream callback: %s", e)
+        
+        async def flush_stream(delay: float):
+            nonlocal flush_task, next_edit_time
+            
+            await asyncio.sleep(delay)
+            next_edit_time = time.monotonic() + EDIT_COOLDOWN
+            output = latest_output
+            await render_stream(output)
+            
+            # Output that arrived during the edit gets its own trailing edit
+            if latest_output != output:
+                delay = max(0.0, next_edit_time - time.monotonic())
+                flush_task = asyncio.create_task(flush_stream(delay))
+            else:
+                flush_task = None
+        
+        async def stream_callback(delta: str, partial: str):
+            nonlocal latest_output, flush_task, stream_tail, stream_truncated
+            
+            # Output arrives as increments; keep only the tail the preview needs
+            if delta:
+                stream_tail += delta
+                if len(stream_tail) > 2 * _STREAM_PREVIEW_CHARS:
+                    stream_tail = stream_tail[-2 * _STREAM_PREVIEW_CHARS:]
+                    stream_truncated = True
+            output = stream_tail + partial
+            if not output:
+                return
+            
+            # Coalesce bursts into one trailing edit that shows the latest output
+            latest_output = output
+            if flush_task is None:
+                delay = max(0.0, next_edit_time - time.monotonic())
+                flush_task = asyncio.create_task(flush_stream(delay))
         
         try:
-            result = await self.orchestrator.execute_command(
-                instruction=instruction,
-                telegram_id=user_id,
-                chat_id=chat_id,
-                output_callback=stream_callback
-            )
+            try:
+                result = await self.orchestrator.execute_command(
+                    instruction=instruction,
+                    telegram_id=user_id,
+                    chat_id=chat_id,
+                    output_callback=stream_callback
+                )
+            finally:
+                # Drop any pending stream edit so it can't overwrite the final message
+                if flush_task:
+                    flush_task.cancel()
+            
+            status_message = await status_task
             
             if result["success"]:
                 output = result["output"]
@@ -310,118 +537,126 @@ class AgenticGramBot:
                 # Handle long outputs
                 if len(final_text) > 4000:
                     # Send as file
-                    from io import BytesIO
                     output_file = BytesIO(output.encode('utf-8'))
                     output_file.name = "claude_output.txt"
                     
                     await update.message.reply_document(
                         document=output_file,
                         filename="claude_output.txt",
-                        caption=f"✅ **Completed** (via {backend})\n\n_Output too long, sent as file_",
-                        parse_mode="Markdown"
+                        caption=f"✅ **Completed** (via {backend})\n\n_Output too long, sent as file_"
                     )
                     await status_message.delete()
                 else:
                     # Update final message
-                    await status_message.edit_text(final_text, parse_mode="Markdown")
+                    await status_message.edit_text(final_text)
             else:
                 error = result.get("error", "Unknown error")
                 await status_message.edit_text(
-                    f"❌ **Error:** {error}",
-                    parse_mode="Markdown"
+                    f"❌ **Error:** {error}"
                 )
         
         except Exception as e:
-            logger.error(f"Error executing code command: {e}", exc_info=True)
+            # Tracebacks only at DEBUG: formatting them is costly on these hot paths
+            logger.error(
+                "Error executing code command: %s: %s", type(e).__name__, e,
+                exc_info=logger.isEnabledFor(logging.DEBUG)
+            )
             try:
+                status_message = await status_task
                 await status_message.edit_text(
-                    f"❌ **Unexpected error:** {str(e)}",
-                    parse_mode="Markdown"
+                    f"❌ **Unexpected error:** {str(e)}"
                 )
             except:
-                await update.message.reply_text(
-                    f"❌ **Unexpected error:** {str(e)}",
-                    parse_mode="Markdown"
+                await reply(
+                    f"❌ **Unexpected error:** {str(e)}"
                 )
+        
+        finally:
+            self._active_code_users.discard(user_id)
     
     async def _cmd_session(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /session command."""
         user_id = update.effective_user.id
+        reply = update.message.reply_text
         
         if not self._check_authorization(user_id):
-            await update.message.reply_text("❌ Unauthorized.")
+            await reply("❌ Unauthorized.")
             return
         
         if not context.args:
-            await update.message.reply_text(
-                "Usage:\n"
-                "/session new - Create new session\n"
-                "/session clear - Clear current session\n"
-                "/session info - Show session info"
-            )
+            await reply(_SESSION_USAGE_MSG)
             return
         
-        action = context.args[0].lower()
-        
-        if action == "new":
-            session = self.session_manager.create_session(user_id)
+        handler = self._session_actions.get(_lower(context.args[0]))
+        if handler:
+            await handler(update, user_id)
+        else:
+            await reply("❌ Unknown action. Use: new, clear, or info")
+    
+    async def _session_new(self, update: Update, user_id: int) -> None:
+        """Handle /session new."""
+        session = self.session_manager.create_session(user_id)
+        await update.message.reply_text(
+            f"✅ New session created!\n"
+            f"Session ID: `{session.session_id}`\n"
+            f"Workspace: `{session.work_dir}`"
+        )
+    
+    async def _session_clear(self, update: Update, user_id: int) -> None:
+        """Handle /session clear."""
+        if self.session_manager.delete_session(user_id):
+            await update.message.reply_text("✅ Session cleared!")
+        else:
+            await update.message.reply_text("ℹ️ No active session to clear.")
+    
+    async def _session_info(self, update: Update, user_id: int) -> None:
+        """Handle /session info."""
+        session = self.session_manager.get_session(user_id)
+        if session:
             await update.message.reply_text(
-                f"✅ New session created!\n"
+                f"📊 **Session Info**\n\n"
                 f"Session ID: `{session.session_id}`\n"
-                f"Workspace: `{session.work_dir}`",
-                parse_mode="Markdown"
+                f"Created: {session.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
+                f"Last used: {session.last_used.strftime('%Y-%m-%d %H:%M:%S')}\n"
+                f"Messages: {session.message_count}\n"
+                f"Workspace: `{session.work_dir}`"
             )
-        
-        elif action == "clear":
-            if self.session_manager.delete_session(user_id):
-                await update.message.reply_text("✅ Session cleared!")
-            else:
-                await update.message.reply_text("ℹ️ No active session to clear.")
-        
-        elif action == "info":
-            session = self.session_manager.get_session(user_id)
-            if session:
-                await update.message.reply_text(
-                    f"📊 **Session Info**\n\n"
-                    f"Session ID: `{session.session_id}`\n"
-                    f"Created: {session.created_at.strftime('%Y-%m-%d %H:%M:%S')}\n"
-                    f"Last used: {session.last_used.strftime('%Y-%m-%d %H:%M:%S')}\n"
-                    f"Messages: {session.message_count}\n"
-                    f"Workspace: `{session.work_dir}`",
-                    parse_mode="Markdown"
-                )
-            else:
-                await update.message.reply_text("ℹ️ No active session. Use `/session new` to create one.")
-        
         else:
-            await update.message.reply_text("❌ Unknown action. Use: new, clear, or info")
+            await update.message.reply_text("ℹ️ No active session. Use `/session new` to create one.")
     
     async def _cmd_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /status command."""
         user_id = update.effective_user.id
+        reply = update.message.reply_text
         
         if not self._check_authorization(user_id):
-            await update.message.reply_text("❌ Unauthorized.")
+            await reply("❌ Unauthorized.")
             return
         
-        await update.message.chat.send_action("typing")
+        # Check backend availability, showing the typing indicator only when
+        # the probes actually have to run
+        if not self.orchestrator.availability_is_fresh():
+            self._send_typing(update)
         
-        # Check backend availability
-        claude_available = await self.orchestrator.check_claude_availability()
-        openrouter_available = await self.orchestrator.check_openrouter_availability()
+        availability = await self.orchestrator.check_all_availability()
+        claude_available = availability.get("claude", False)
+        openrouter_available = availability.get("openrouter", False)
         
-        status_message = "🔍 **Backend Status**\n\n"
-        status_message += f"Claude Code CLI: {'✅ Available' if claude_available else '❌ Unavailable'}\n"
-        status_message += f"OpenRouter API: {'✅ Available' if openrouter_available else '❌ Unavailable'}\n"
+        status_message = (
+            "🔍 **Backend Status**\n\n"
+            f"Claude Code CLI: {'✅ Available' if claude_available else '❌ Unavailable'}\n"
+            f"OpenRouter API: {'✅ Available' if openrouter_available else '❌ Unavailable'}\n"
+        )
         
-        await update.message.reply_text(status_message, parse_mode="Markdown")
+        await reply(status_message)
     
     async def _cmd_browse(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /browse command to navigate directories."""
         user_id = update.effective_user.id
+        reply = update.message.reply_text
         
         if not self._check_authorization(user_id):
-            await update.message.reply_text("❌ Unauthorized.")
+            await reply("❌ Unauthorized.")
             return
         
         # Determine starting directory
@@ -433,10 +668,9 @@ class AgenticGramBot:
         # Validate directory
         is_safe, error_msg = self.directory_browser.is_safe_directory(str(start_path))
         if not is_safe:
-            await update.message.reply_text(
+            await reply(
                 f"❌ Cannot access directory: {error_msg}\n\n"
-                f"Starting from default: `{self.directory_browser.format_directory_path(str(self.directory_browser.start_dir))}`",
-                parse_mode="Markdown"
+                f"Starting from default: `{self.directory_browser.format_directory_path(str(self.directory_browser.start_dir))}`"
             )
             start_path = self.directory_browser.start_dir
         
@@ -444,22 +678,23 @@ class AgenticGramBot:
         self.user_navigation[user_id] = str(start_path)
         
         # Get directory info and keyboard
-        info = self.directory_browser.get_directory_info(str(start_path))
-        keyboard = self.directory_browser.create_navigation_keyboard(str(start_path))
+        info, keyboard = self.directory_browser.get_directory_view(str(start_path))
         
-        await update.message.reply_text(
+        await reply(
             info + "\n\nSelect a folder to navigate or choose an action:",
-            reply_markup=keyboard,
-            parse_mode="Markdown"
+            reply_markup=keyboard
         )
+        
+        logger.info("User %s started browsing from %s", user_id, start_path)
     
     async def _cmd_trust(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle /trust command to trust a directory for Claude CLI."""
         user_id = update.effective_user.id
+        reply = update.message.reply_text
         
         # Check authorization
-        if not self._is_authorized(user_id):
-            await update.message.reply_text("❌ Unauthorized")
+        if not self._check_authorization(user_id):
+            await reply("❌ Unauthorized.")
             return
         
         # Get directory path from arguments or use current work directory
@@ -469,74 +704,74 @@ class AgenticGramBot:
             # Use current work directory
             session = self.session_manager.get_session(user_id)
             if not session:
-                await update.message.reply_text(
-                    "❌ No directory specified and no active session.\n\n"
-                    "Usage: `/trust <directory_path>`\n"
-                    "Example: `/trust /home/tony/projects`",
-                    parse_mode="Markdown"
-                )
+                await reply(_TRUST_USAGE_MSG)
                 return
-            directory = session.work_dir
+            directory = str(session.work_dir)
         
         # Resolve path
         try:
             resolved_path = Path(directory).resolve()
             
             if not resolved_path.exists():
-                await update.message.reply_text(
-                    f"❌ Directory does not exist: `{directory}`",
-                    parse_mode="Markdown"
+                await reply(
+                    f"❌ Directory does not exist: `{directory}`"
                 )
                 return
             
             if not resolved_path.is_dir():
-                await update.message.reply_text(
-                    f"❌ Path is not a directory: `{directory}`",
-                    parse_mode="Markdown"
+                await reply(
+                    f"❌ Path is not a directory: `{directory}`"
                 )
                 return
             
-            # Run claude trust command
-            import subprocess
-            result = subprocess.run(
-                ["claude", "trust", str(resolved_path)],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
+            # Run claude trust command (skipped for directories already trusted)
+            if resolved_path in self._trusted_dirs:
+                returncode = 0
+            else:
+                process = await asyncio.create_subprocess_exec(
+                    "claude", "trust", str(resolved_path),
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                try:
+                    stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=10)
+                except asyncio.TimeoutError:
+                    process.kill()
+                    await process.wait()
+                    raise
+                returncode = process.returncode
             
-            if result.returncode == 0:
-                await update.message.reply_text(
+            if returncode == 0:
+                self._trusted_dirs.add(resolved_path)
+                await reply(
                     f"✅ **Directory Trusted**\n\n"
                     f"Claude will no longer ask for permissions in:\n"
                     f"`{resolved_path}`\n\n"
-                    f"**Note:** This applies to all Claude CLI sessions, not just this bot.",
-                    parse_mode="Markdown"
+                    f"**Note:** This applies to all Claude CLI sessions, not just this bot."
                 )
-                logger.info(f"User {user_id} trusted directory: {resolved_path}")
+                logger.info("User %s trusted directory: %s", user_id, resolved_path)
             else:
-                error = result.stderr or result.stdout or "Unknown error"
-                await update.message.reply_text(
+                error = (
+                    stderr.decode(errors="replace").strip()
+                    or stdout.decode(errors="replace").strip()
+                    or "Unknown error"
+                )
+                await reply(
                     f"❌ **Failed to trust directory**\n\n"
                     f"Error: `{error}`\n\n"
-                    f"Make sure Claude CLI is installed and accessible.",
-                    parse_mode="Markdown"
+                    f"Make sure Claude CLI is installed and accessible."
                 )
-                logger.error(f"Failed to trust directory {resolved_path}: {error}")
+                logger.error("Failed to trust directory %s: %s", resolved_path, error)
                 
-        except subprocess.TimeoutExpired:
-            await update.message.reply_text(
-                "❌ Command timed out. Please try again.",
-                parse_mode="Markdown"
+        except asyncio.TimeoutError:
+            await reply(
+                "❌ Command timed out. Please try again."
             )
         except Exception as e:
-            await update.message.reply_text(
-                f"❌ Error: {str(e)}",
-                parse_mode="Markdown"
+            await reply(
+                f"❌ Error: {str(e)}"
             )
-            logger.error(f"Error in /trust command: {e}", exc_info=True)
-        
-        logger.info(f"User {user_id} started browsing from {start_path}")
+            logger.error("Error in /trust command: %s", e, exc_info=True)
     
     async def _handle_directory_callback(self, query) -> None:
         """Handle directory navigation callback queries."""
@@ -544,43 +779,44 @@ class AgenticGramBot:
         data = query.data
         
         try:
-            # Parse callback data
-            parts = data.split("_", 2)
-            action = parts[1]
+            # Parse callback data: dir_<action>[_<path_id>[_<page_num>]]
+            action, _, payload = data[len("dir_"):].partition("_")
             
             if action == "cancel":
                 await query.edit_message_text("❌ Directory selection cancelled.")
                 self.user_navigation.pop(user_id, None)
                 return
             
-            # Decode path from callback data using registry
-            if len(parts) >= 3:
-                if action == "page":
-                    # Format: dir_page_<path_id>_<page_num>
-                    path_and_page = parts[2].rsplit("_", 1)
-                    path_id = path_and_page[0]
-                    page = int(path_and_page[1])
-                    current_path = self.directory_browser.get_path(path_id)
-                    if not current_path:
-                        await query.edit_message_text("❌ Navigation session expired. Use /browse to start again.")
-                        return
-                else:
-                    path_id = parts[2]
-                    current_path = self.directory_browser.get_path(path_id)
-                    if not current_path:
-                        await query.edit_message_text("❌ Navigation session expired. Use /browse to start again.")
-                        return
-                    page = 0
-            else:
+            if not payload:
                 await query.edit_message_text("❌ Invalid navigation data.")
                 return
             
-            # Validate directory
-            is_safe, error_msg = self.directory_browser.is_safe_directory(current_path)
-            if not is_safe:
-                await query.edit_message_text(f"❌ Cannot access directory: {error_msg}")
+            path_id = payload
+            page = 0
+            if action == "page":
+                # Format: dir_page_<path_id>_<page_num>
+                path_id, _, page_num = payload.rpartition("_")
+                page = int(page_num)
+            
+            # Decode path from callback data using registry
+            current_path = self.directory_browser.get_path(path_id)
+            if not current_path:
+                await query.edit_message_text("❌ Navigation session expired. Use /browse to start again.")
                 return
             
+            # Validate directory; navigation may trust a recent check made when
+            # its view or "Go Up" button was built, but subdirectories listed for
+            # "open" were never checked (e.g. symlinks out of the allowed tree) and
+            # "select" always re-checks since it grants the workspace
+            if action == "select" or not self.directory_browser.is_validated(current_path):
+                is_safe, error_msg = self.directory_browser.is_safe_directory(current_path)
+                if not is_safe:
+                    await query.edit_message_text(
+                        f"❌ Cannot access directory: {error_msg}",
+                        parse_mode=None
+                    )
+                    return
+            
             # Handle different actions
             if action == "select":
                 # User selected this directory
@@ -590,10 +826,9 @@ class AgenticGramBot:
                         f"✅ **Working directory set!**\n\n"
                         f"Selected: `{self.directory_browser.format_directory_path(current_path, 60)}`\n"
                         f"Workspace: `{session.work_dir}`\n\n"
-                        f"You can now use `/code` commands in this workspace.",
-                        parse_mode="Markdown"
+                        f"You can now use `/code` commands in this workspace."
                     )
-                    logger.info(f"User {user_id} set work directory to {current_path}")
+                    logger.info("User %s set work directory to %s", user_id, current_path)
                 else:
                     # Failed to set directory - likely permission issue
                     await query.edit_message_text(
@@ -606,10 +841,9 @@ class AgenticGramBot:
                         f"   `chmod -R 755 {current_path}`\n"
                         f"   or\n"
                         f"   `sudo chown -R $USER:$USER {current_path}`\n\n"
-                        f"Use `/browse` to try again.",
-                        parse_mode="Markdown"
+                        f"Use `/browse` to try again."
                     )
-                    logger.error(f"User {user_id} failed to set work directory: {current_path}")
+                    logger.error("User %s failed to set work directory: %s", user_id, current_path)
                 
                 self.user_navigation.pop(user_id, None)
                 return
@@ -627,25 +861,24 @@ class AgenticGramBot:
                 pass  # current_path and page already set
             
             # Update message with new directory view
-            info = self.directory_browser.get_directory_info(current_path)
-            keyboard = self.directory_browser.create_navigation_keyboard(current_path, page)
+            info, keyboard = self.directory_browser.get_directory_view(current_path, page)
             
             await query.edit_message_text(
                 info + "\n\nSelect a folder to navigate or choose an action:",
-                reply_markup=keyboard,
-                parse_mode="Markdown"
+                reply_markup=keyboard
             )
             
         except Exception as e:
-            logger.error(f"Error handling directory callback: {e}", exc_info=True)
-            await query.edit_message_text(f"❌ Error: {str(e)}")
+            logger.error("Error handling directory callback: %s", e, exc_info=True)
+            await query.edit_message_text(f"❌ Error: {str(e)}", parse_mode=None)
     
     async def _handle_file(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle file uploads."""
         user_id = update.effective_user.id
+        reply = update.message.reply_text
         
         if not self._check_authorization(user_id):
-            await update.message.reply_text("❌ Unauthorized.")
+            await reply("❌ Unauthorized.")
             return
         
         document = update.message.document
@@ -653,37 +886,64 @@ class AgenticGramBot:
         
         # Validate file type
         if not validate_file_type(filename):
-            await update.message.reply_text(
-                "❌ Unsupported file type. Allowed: .py, .sql, .js, .txt, .json, .md"
-            )
+            await reply(_UNSUPPORTED_FILE_MSG)
             return
         
         # Get or create session
-        session = self.session_manager.get_session(user_id)
-        if not session:
-            session = self.session_manager.create_session(user_id)
+        session = self.session_manager.get_or_create_session(user_id)
         
         # Download file
         try:
-            file = await document.get_file()
-            file_path = Path(session.work_dir) / filename
-            await file.download_to_drive(str(file_path))
+            file_path = session.work_dir / filename
             
-            file_size = format_file_size(document.file_size)
+            # Reuse this user's earlier save of the same file, unless it has
+            # been edited in the workspace since (size or mtime changed)
+            cache_key = (user_id, document.file_unique_id)
+            cached = self._uploaded_files.get(cache_key)
+            if cached is not None and _is_unmodified_save(*cached):
+                cached_path = cached[0]
+                if cached_path != file_path:
+                    await asyncio.to_thread(shutil.copyfile, cached_path, file_path)
+            else:
+                await self._download_document(document, file_path)
             
-            await update.message.reply_text(
-                f"✅ File saved!\n"
-                f"Name: `{filename}`\n"
-                f"Size: {file_size}\n"
-                f"Location: `{file_path}`",
-                parse_mode="Markdown"
-            )
+            stat = file_path.stat()
+            self._uploaded_files[cache_key] = (file_path, stat.st_size, stat.st_mtime_ns)
             
-            logger.info(f"User {user_id} uploaded file: {filename}")
+            await reply("".join((
+                "✅ File saved!\nName: `", filename,
+                "`\nSize: ", format_file_size(document.file_size),
+                "\nLocation: `", str(file_path), "`"
+            )))
+            
+            logger.info("User %s uploaded file: %s", user_id, filename)
         
         except Exception as e:
-            logger.error(f"Error handling file upload: {e}", exc_info=True)
-            await update.message.reply_text(f"❌ Error saving file: {str(e)}")
+            logger.error(
+                "Error handling file upload: %s: %s", type(e).__name__, e,
+                exc_info=logger.isEnabledFor(logging.DEBUG)
+            )
+            await reply(f"❌ Error saving file: {str(e)}", parse_mode=None)
+    
+    async def _download_document(self, document, file_path: Path) -> None:
+        """
+        Download an uploaded document, streaming it to disk.
+        
+        Args:
+            document: Telegram document to download
+            file_path: Destination path
+        """
+        file = await document.get_file()
+        
+        # Stream to disk so large uploads aren't buffered in memory
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=120)) as http:
+            async with http.get(file.file_path) as response:
+                if response.status != 200:
+                    # Don't surface the URL: it embeds the bot token
+                    raise RuntimeError(f"Download failed with HTTP {response.status}")
+                async with aiofiles.open(file_path, "wb") as out:
+                    async for chunk in response.content.iter_chunked(_DOWNLOAD_CHUNK_SIZE):
+                        await out.write(chunk)
     
     async def _handle_permission_request(
         self,
@@ -702,103 +962,43 @@ class AgenticGramBot:
             True if approved, False if denied
         """
         # Generate unique request ID
-        request_id = str(uuid.uuid4())[:8]  # Short ID for callback data
+        request_id = secrets.token_hex(4)  # Short ID for callback data
         
         # Create future for async response
         future = asyncio.Future()
         self.pending_permissions[request_id] = future
         
-        # Get current chat_id (set by _cmd_code before executing)
-        chat_id = getattr(self, 'current_chat_id', None)
+        # Get the chat of the /code run this prompt belongs to
+        chat_id = _current_chat_id.get()
         if not chat_id:
             logger.error("No chat_id available for permission request")
             return False
         
         try:
-            # Format permission message
-            # Escape markdown in description to prevent parsing errors
-            raw_description = details.get('description', 'Unknown action')
-            description = escape_markdown(raw_description)
+            # Format permission message; prompts about a specific target show
+            # that instead of the description. Escape markdown in either to
+            # prevent parsing errors
+            template, target_fallback = _PERMISSION_PROMPTS.get(
+                action_type, (_PERMISSION_PROMPT_DEFAULT, None)
+            )
+            if target_fallback is None:
+                text = details.get('description', 'Unknown action')
+            else:
+                text = details.get('target', target_fallback)
+            message = template.format(escape_markdown(text))
             
-            # Create message based on action type
             if action_type == "menu_prompt":
-                # This is a menu with numbered options
-                message = f"🔐 **Claude is asking:**\n\n{description}\n\n**Please select an option:**"
-                
-                # Create buttons for each menu option
-                menu_options = details.get('options', [])
-                keyboard = []
-                for option in menu_options:
-                    number = option['number']
-                    text = option['text']
-                    # Create button with option number as callback data
-                    keyboard.append([
-                        InlineKeyboardButton(
-                            f"{number}. {text[:50]}", # Limit text length
-                            callback_data=f"perm_{request_id}_{number}"
-                        )
-                    ])
-                
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-            elif action_type == "interactive_prompt":
-                # This is a yes/no question from Claude
-                message = f"🔐 **Claude is asking:**\n\n{description}\n\n**Please respond:**"
-                # Create inline keyboard with Yes/No buttons
-                keyboard = [
-                    [
-                        InlineKeyboardButton("✅ Yes", callback_data=f"perm_{request_id}_yes"),
-                        InlineKeyboardButton("❌ No", callback_data=f"perm_{request_id}_no")
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-            elif action_type == "directory_access":
-                target = escape_markdown(details.get('target', 'unknown directory'))
-                message = f"🔐 **Permission Required**\n\nClaude wants to access:\n`{target}`\n\n**Allow access?**"
-                # Create inline keyboard with Yes/No buttons
+                # Create one button per menu option, with the option number as callback data
                 keyboard = [
-                    [
-                        InlineKeyboardButton("✅ Yes", callback_data=f"perm_{request_id}_yes"),
-                        InlineKeyboardButton("❌ No", callback_data=f"perm_{request_id}_no")
-                    ]
+                    [InlineKeyboardButton(
+                        f"{option['number']}. {option['text'][:50]}",  # Limit text length
+                        callback_data=f"perm_{request_id}_{option['number']}"
+                    )]
+                    for option in details.get('options', [])
                 ]
                 reply_markup = InlineKeyboardMarkup(keyboard)
-                
-            elif action_type == "file_edit":
-                target = escape_markdown(details.get('target', 'unknown file'))
-                message = f"🔐 **Permission Required**\n\nClaude wants to edit:\n`{target}`\n\n**Allow this action?**"
-                # Create inline keyboard with Yes/No buttons
-                keyboard = [
-                    [
-                        InlineKeyboardButton("✅ Yes", callback_data=f"perm_{request_id}_yes"),
-                        InlineKeyboardButton("❌ No", callback_data=f"perm_{request_id}_no")
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-            elif action_type == "command_exec":
-                target = escape_markdown(details.get('target', 'unknown command'))
-                message = f"🔐 **Permission Required**\n\nClaude wants to run:\n`{target}`\n\n**Allow this command?**"
-                # Create inline keyboard with Yes/No buttons
-                keyboard = [
-                    [
-                        InlineKeyboardButton("✅ Yes", callback_data=f"perm_{request_id}_yes"),
-                        InlineKeyboardButton("❌ No", callback_data=f"perm_{request_id}_no")
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
             else:
-                message = f"🔐 **Permission Required**\n\n{description}\n\n**Approve?**"
-                # Create inline keyboard with Yes/No buttons
-                keyboard = [
-                    [
-                        InlineKeyboardButton("✅ Yes", callback_data=f"perm_{request_id}_yes"),
-                        InlineKeyboardButton("❌ No", callback_data=f"perm_{request_id}_no")
-                    ]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = _yes_no_markup(request_id)
             
             # Send permission request to user with retries
             max_retries = 3
@@ -809,46 +1009,51 @@ class AgenticGramBot:
                     sent_message = await self.app.bot.send_message(
                         chat_id=chat_id,
                         text=message,
-                        reply_markup=reply_markup,
-                        parse_mode="Markdown"
+                        reply_markup=reply_markup
                     )
                     break # Success!
-                except TimedOut:
+                except (TimedOut, RetryAfter) as e:
                     if attempt == max_retries - 1:
-                        logger.error(f"Failed to send permission request {request_id} after {max_retries} attempts due to timeout")
+                        logger.error("Failed to send permission request %s after %s attempts: %s", request_id, max_retries, e)
                         return False
-                    logger.warning(f"Timeout sending permission request {request_id}, retrying ({attempt + 1}/{max_retries})...")
-                    await asyncio.sleep(1) # Wait a bit before retrying
+                    if isinstance(e, RetryAfter):
+                        # Flood control: wait as long as Telegram asks
+                        delay = e.retry_after
+                    else:
+                        # Capped exponential backoff with jitter so concurrent
+                        # permission flows don't retry in lockstep
+                        delay = min(0.25 * 2 ** attempt, 4.0) * (0.5 + random.random())
+                    logger.warning("Could not send permission request %s (%s), retrying in %.1fs (%d/%d)...", request_id, e, delay, attempt + 1, max_retries)
+                    await asyncio.sleep(delay)
                 except Exception as e:
-                    logger.error(f"Error sending permission request: {e}")
+                    logger.error("Error sending permission request: %s", e)
                     return False
             
             if not sent_message:
                 return False
 
-            logger.info(f"Sent permission request {request_id} to chat {chat_id}")
+            logger.info("Sent permission request %s to chat %s", request_id, chat_id)
             
             # Wait for user response with timeout
             async with asyncio.timeout(self.permission_timeout):
                 approved = await future
-                logger.info(f"Permission request {request_id} {'approved' if approved else 'denied'}")
+                logger.info("Permission request %s %s", request_id, "approved" if approved else "denied")
                 return approved
                 
         except asyncio.TimeoutError:
-            logger.warning(f"Permission request {request_id} timed out")
+            logger.warning("Permission request %s timed out", request_id)
             # Send timeout message
             try:
                 await self.app.bot.send_message(
                     chat_id=chat_id,
-                    text="⏱️ Permission request timed out. Denied by default.",
-                    parse_mode="Markdown"
+                    text=_PERMISSION_TIMEOUT_MSG
                 )
             except:
                 pass
             return False
             
         except Exception as e:
-            logger.error(f"Error handling permission request: {e}", exc_info=True)
+            logger.error("Error handling permission request: %s", e, exc_info=True)
             return False
             
         finally:
@@ -858,8 +1063,19 @@ class AgenticGramBot:
     async def _handle_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle inline keyboard button callbacks."""
         query = update.callback_query
-        await query.answer()
         
+        # Acknowledge the button press while the callback is processed
+        await asyncio.gather(self._answer_callback(query), self._dispatch_callback(query))
+    
+    async def _answer_callback(self, query) -> None:
+        """Acknowledge a callback query, ignoring failures (e.g. expired queries)."""
+        try:
+            await query.answer()
+        except Exception as e:
+            logger.debug("Callback answer failed: %s", e)
+    
+    async def _dispatch_callback(self, query) -> None:
+        """Route a callback query to the matching handler."""
         # Check if it's a directory navigation callback
         if query.data.startswith("dir_"):
             await self._handle_directory_callback(query)
@@ -893,20 +1109,19 @@ class AgenticGramBot:
         # Update message
         result_text = "✅ Approved" if approved else "❌ Denied"
         await query.edit_message_text(
-            f"{query.message.text}\n\n**Decision:** {result_text}"
+            f"{query.message.text}\n\n**Decision:** {result_text}",
+            parse_mode=None
         )
     
     async def _handle_permission_callback(self, query) -> None:
         """Handle permission button callbacks."""
-        # Parse: perm_<request_id>_<yes|no|1|2|3...>
-        parts = query.data.split("_")
-        if len(parts) != 3:
+        # Parse: perm_<request_id>_<yes|no|1|2|3...> (the prefix was checked by
+        # _dispatch_callback; request IDs are hex so contain no underscore)
+        request_id, _, action = query.data[len("perm_"):].partition("_")
+        if not action:
             await query.edit_message_text("❌ Invalid permission data")
             return
         
-        request_id = parts[1]
-        action = parts[2]  # "yes", "no", or a number (menu option)
-        
         # Get pending permission future
         future = self.pending_permissions.get(request_id)
         if not future:
@@ -914,7 +1129,7 @@ class AgenticGramBot:
             return
         
         # Set result based on action type
-        if action in ["yes", "no"]:
+        if action in _YES_NO_ACTIONS:
             # Yes/No response
             approved = (action == "yes")
             future.set_result(approved)
@@ -926,8 +1141,7 @@ class AgenticGramBot:
         
         # Update message
         await query.edit_message_text(
-            f"{query.message.text}\n\n**Decision:** {result_text}",
-            parse_mode="Markdown"
+            f"{query.message.text}\n\n**Decision:** {result_text}"
         )
     
     async def run(self) -> None:
@@ -936,7 +1150,7 @@ class AgenticGramBot:
         
         # Start cleanup task
         if self.config["AUTO_CLEANUP_SESSIONS"]:
-            asyncio.create_task(self._cleanup_task())
+            self._spawn(self._cleanup_task())
         
         # Run bot
         await self.app.initialize()
@@ -960,13 +1174,15 @@ class AgenticGramBot:
                     self.config["MAX_SESSION_AGE_HOURS"]
                 )
                 if count > 0:
-                    logger.info(f"Cleaned up {count} old sessions")
+                    logger.info("Cleaned up %d old sessions", count)
             except Exception as e:
-                logger.error(f"Error in cleanup task: {e}", exc_info=True)
+                logger.error("Error in cleanup task: %s", e, exc_info=True)
     
     async def shutdown(self) -> None:
         """Shutdown the bot gracefully."""
         logger.info("Shutting down bot...")
+        for task in list(self._background_tasks):
+            task.cancel()
         await self.orchestrator.cleanup()
         await self.app.stop()
         await self.app.shutdown()
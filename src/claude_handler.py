@@ -4,11 +4,12 @@ Manages interaction with Claude Code CLI, including permission handling.
 """
 
 import asyncio
+import functools
 import logging
+import os
 import re
-import uuid
-from typing import Optional, Callable, Dict, Any
-from datetime import datetime
+import shutil
+from typing import Optional, Callable, Dict, Any, Tuple
 from pathlib import Path
 
 from .pty_handler import PTYHandler
@@ -16,6 +17,60 @@ from .pty_handler import PTYHandler
 
 logger = logging.getLogger(__name__)
 
+# Phrases identifying Claude's directory trust prompt
+_TRUST_PATTERNS = (
+    "Yes, I trust this folder",
+    "Is this a project you created",
+    "Quick safety check",
+    "trust this folder"
+)
+
+# Markers of a yes/no prompt
+_YES_NO_INDICATORS = ("(y/n)", "(yes/no)", "[Y/n]", "[y/N]")
+
+# Classifies a prompt in one pass: trust phrases, yes/no markers, or a
+# numbered menu option at the start of a line
+_PROMPT_CLASSIFIER_RE = re.compile(
+    "(?P<trust>" + "|".join(map(re.escape, _TRUST_PATTERNS)) + ")"
+    "|(?P<yes_no>" + "|".join(map(re.escape, _YES_NO_INDICATORS)) + ")"
+    r"|(?P<menu>^\s*\d+\.)",
+    re.MULTILINE
+)
+
+# Prompt categories in order of precedence
+_PROMPT_PRIORITY = {"trust": 0, "yes_no": 1, "menu": 2}
+
+# Pre-encoded keystrokes written back to the PTY
+_RESPONSE_YES = b"y\n"
+_RESPONSE_NO = b"n\n"
+_RESPONSE_FIRST_OPTION = b"1\n"
+
+
+def _classify_prompt(prompt_text: str) -> Optional[str]:
+    """
+    Classify an interactive prompt.
+    
+    Args:
+        prompt_text: The prompt text (ANSI codes already stripped)
+        
+    Returns:
+        'trust', 'yes_no' or 'menu' (highest precedence found), or None
+    """
+    best = None
+    for match in _PROMPT_CLASSIFIER_RE.finditer(prompt_text):
+        kind = match.lastgroup
+        if kind == "trust":
+            return kind
+        if best is None or _PROMPT_PRIORITY[kind] < _PROMPT_PRIORITY[best]:
+            best = kind
+    return best
+
+
+@functools.lru_cache(maxsize=32)
+def _option_response(option: str) -> bytes:
+    """Encode the keystrokes selecting a numbered menu option."""
+    return f"{option}\n".encode()
+
 
 class ClaudeHandler:
     """Handles Claude Code CLI execution and permission management."""
@@ -30,24 +85,53 @@ class ClaudeHandler:
             claude_path: Optional custom path to Claude CLI executable
         """
         self.permission_callback = permission_callback
-        self.pending_permissions: Dict[str, asyncio.Future] = {}
         # Use custom path if provided, otherwise default to 'claude' command
         self.claude_path = claude_path or "claude"
         
+        # Fixed part of the CLI argv; the instruction is appended per call
+        self._command_prefix = (self.claude_path,)
+        
+        # Executable (resolved path, mtime) that last passed the availability
+        # check; failures aren't cached so a fixed environment is picked up
+        self._available_executable: Optional[Tuple[str, int]] = None
+        
         # Initialize PTY handler
         self.pty_handler = PTYHandler()
         
-        logger.info(f"Claude handler initialized with path: {self.claude_path}")
+        logger.info("Claude handler initialized with path: %s", self.claude_path)
+    
+    def _executable_key(self) -> Optional[Tuple[str, int]]:
+        """
+        Identify the current Claude CLI executable.
+        
+        Returns:
+            Tuple of (resolved path, mtime in ns), or None if it can't be found
+        """
+        path = shutil.which(self.claude_path)
+        if path is None:
+            return None
+        try:
+            return path, os.stat(path).st_mtime_ns
+        except OSError:
+            return None
     
     async def check_availability(self) -> bool:
         """
         Check if Claude Code CLI is available.
         
+        A successful check is reused until the executable changes, so repeated
+        checks don't spawn `claude --version` each time. Failures are always
+        rechecked, since their cause (PATH, node, home directory) may be fixed.
+        
         Returns:
             True if available, False otherwise
         """
+        executable_key = self._executable_key()
+        if executable_key is not None and executable_key == self._available_executable:
+            return True
+        
         try:
-            logger.debug(f"Checking Claude CLI availability at: {self.claude_path}")
+            logger.debug("Checking Claude CLI availability at: %s", self.claude_path)
             
             process = await asyncio.create_subprocess_exec(
                 self.claude_path, "--version",
@@ -58,25 +142,28 @@ class ClaudeHandler:
             
             if process.returncode == 0:
                 version = stdout.decode().strip()
-                logger.info(f"Claude CLI is available: {version}")
-                return True
+                logger.info("Claude CLI is available: %s", version)
+                available = True
             else:
                 error = stderr.decode().strip()
-                logger.warning(f"Claude CLI check failed: {error}")
-                return False
+                logger.warning("Claude CLI check failed: %s", error)
+                available = False
+            
+            self._available_executable = executable_key if available else None
+            return available
         except FileNotFoundError as e:
-            logger.error(f"Claude CLI not found at '{self.claude_path}': {e}")
+            logger.error("Claude CLI not found at '%s': %s", self.claude_path, e)
             logger.error("Hint: Set CLAUDE_CODE_PATH environment variable or ensure 'claude' is in PATH")
             return False
         except Exception as e:
-            logger.error(f"Error checking Claude CLI availability: {e}", exc_info=True)
+            logger.error("Error checking Claude CLI availability: %s", e, exc_info=True)
             return False
     
     async def execute_command(
         self,
         instruction: str,
         work_dir: str,
-        output_callback: Optional[Callable[[str], Any]] = None,
+        output_callback: Optional[Callable[[str, str], Any]] = None,
         timeout: int = 1800  # 30 minutes for long tasks
     ) -> Dict[str, Any]:
         """
@@ -85,23 +172,23 @@ class ClaudeHandler:
         Args:
             instruction: The instruction to send to Claude Code
             work_dir: Working directory for the command
-            output_callback: Optional callback for streaming output
+            output_callback: Optional callback for streaming output, called with
+                             (new finished output, current partial line)
             timeout: Command timeout in seconds
             
         Returns:
             Dictionary with 'success', 'output', and optional 'error' keys
         """
         try:
-            # Ensure working directory exists
-            Path(work_dir).mkdir(parents=True, exist_ok=True)
+            # Ensure working directory exists; a single stat covers the usual
+            # case, and a directory deleted since the last run is recreated
+            if not os.path.isdir(work_dir):
+                Path(work_dir).mkdir(parents=True, exist_ok=True)
             
             # Build command without session ID - Claude manages sessions automatically
-            command = [
-                self.claude_path,
-                instruction
-            ]
+            command = [*self._command_prefix, instruction]
             
-            logger.info(f"Executing Claude CLI with PTY in {work_dir}")
+            logger.info("Executing Claude CLI with PTY in %s", work_dir)
             
             # Execute with PTY
             result = await self.pty_handler.execute_with_pty(
@@ -113,21 +200,21 @@ class ClaudeHandler:
             )
             
             if result["success"]:
-                logger.info(f"Command completed successfully")
+                logger.info("Command completed successfully")
             else:
-                logger.error(f"Command failed: {result.get('error', 'Unknown error')}")
+                logger.error("Command failed: %s", result.get('error', 'Unknown error'))
             
             return result
             
         except Exception as e:
-            logger.error(f"Error executing Claude Code command: {e}", exc_info=True)
+            logger.error("Error executing Claude Code command: %s", e, exc_info=True)
             return {
                 "success": False,
                 "output": "",
                 "error": f"Unexpected error: {str(e)}"
             }
     
-    async def _handle_interactive_prompt(self, prompt_text: str) -> str:
+    async def _handle_interactive_prompt(self, prompt_text: str) -> bytes:
         """
         Handle interactive prompts from Claude CLI.
         
@@ -135,23 +222,17 @@ class ClaudeHandler:
             prompt_text: The prompt text (ANSI codes already stripped)
             
         Returns:
-            Response to send to Claude (e.g., "1\n", "y\n", "n\n")
+            Encoded response to send to Claude (e.g., b"1\n", b"y\n", b"n\n")
         """
-        # Patterns for directory trust prompts
-        trust_patterns = [
-            "Yes, I trust this folder",
-            "Is this a project you created",
-            "Quick safety check",
-            "trust this folder"
-        ]
+        prompt_type = _classify_prompt(prompt_text)
         
         # Check if it's a directory trust prompt
-        if any(pattern in prompt_text for pattern in trust_patterns):
+        if prompt_type == "trust":
             logger.info("Auto-approving directory trust prompt")
-            return "1\n"  # Select option 1 (Yes, I trust)
+            return _RESPONSE_FIRST_OPTION  # Select option 1 (Yes, I trust)
         
         # Check for yes/no prompts
-        if any(indicator in prompt_text for indicator in ["(y/n)", "(yes/no)", "[Y/n]", "[y/N]"]):
+        if prompt_type == "yes_no":
             # Forward to permission callback
             if self.permission_callback:
                 logger.info("Forwarding yes/no prompt to user via Telegram")
@@ -160,18 +241,18 @@ class ClaudeHandler:
                         "description": prompt_text,
                         "prompt_type": "yes_no"
                     })
-                    response = "y\n" if approved else "n\n"
-                    logger.info(f"User {'approved' if approved else 'denied'} prompt")
+                    response = _RESPONSE_YES if approved else _RESPONSE_NO
+                    logger.info("User %s prompt", 'approved' if approved else 'denied')
                     return response
                 except Exception as e:
-                    logger.error(f"Error in permission callback: {e}", exc_info=True)
-                    return "n\n"  # Default to deny on error
+                    logger.error("Error in permission callback: %s", e, exc_info=True)
+                    return _RESPONSE_NO  # Default to deny on error
             else:
                 logger.warning("No permission callback set, denying prompt")
-                return "n\n"
+                return _RESPONSE_NO
         
         # Check for numbered menu options
-        if re.search(r'^\s*\d+\.', prompt_text, re.MULTILINE):
+        if prompt_type == "menu":
             # It's a menu - extract options and forward to user
             if self.permission_callback:
                 logger.info("Detected menu prompt, extracting options...")
@@ -180,7 +261,7 @@ class ClaudeHandler:
                 menu_options = self.pty_handler._extract_menu_options(prompt_text)
                 
                 if menu_options:
-                    logger.info(f"Found {len(menu_options)} menu options")
+                    logger.info("Found %s menu options", len(menu_options))
                     try:
                         # Send menu to Telegram with options as buttons
                         response_number = await self.permission_callback("menu_prompt", {
@@ -191,118 +272,22 @@ class ClaudeHandler:
                         
                         # Response should be the option number
                         if response_number:
-                            logger.info(f"User selected option {response_number}")
-                            return f"{response_number}\n"
+                            logger.info("User selected option %s", response_number)
+                            return _option_response(str(response_number))
                         else:
                             logger.warning("No option selected, defaulting to 1")
-                            return "1\n"
+                            return _RESPONSE_FIRST_OPTION
                     except Exception as e:
-                        logger.error(f"Error handling menu: {e}", exc_info=True)
-                        return "1\n"
+                        logger.error("Error handling menu: %s", e, exc_info=True)
+                        return _RESPONSE_FIRST_OPTION
                 else:
                     # Couldn't extract options, auto-select 1
                     logger.warning("Couldn't extract menu options, auto-selecting 1")
-                    return "1\n"
+                    return _RESPONSE_FIRST_OPTION
         
         # Unknown prompt type - log and deny
-        logger.warning(f"Unknown prompt type, denying: {prompt_text[:100]}")
-        return "n\n"
-    
-    def _parse_permission_request(self, line: str) -> Optional[Dict[str, Any]]:
-        """
-        Parse a line to detect permission requests from Claude Code.
-        
-        Args:
-            line: Output line from Claude Code
-            
-        Returns:
-            Dictionary with permission details if detected, None otherwise
-        """
-        # Detect interactive yes/no prompts (most common from Claude)
-        # Patterns like: "Allow access to /path? (y/n)", "Do you want to proceed? (yes/no)"
-        interactive_patterns = [
-            r'\(y/n\)',
-            r'\(yes/no\)',
-            r'\[y/N\]',
-            r'\[Y/n\]',
-            r'\(y/N\)',
-            r'\(Y/n\)',
-        ]
-        
-        for pattern in interactive_patterns:
-            if re.search(pattern, line, re.IGNORECASE):
-                # This is an interactive prompt
-                return {
-                    "action_type": "interactive_prompt",
-                    "details": {
-                        "description": line.strip(),
-                        "prompt_type": "yes_no"
-                    }
-                }
-        
-        # Detect specific permission patterns
-        permission_patterns = [
-            (r'(?:Allow|Grant|Trust|Permit)\s+(?:access to|directory|path):\s*(.+)', "directory_access"),
-            (r'(?:Edit|Modify|Create|Delete)\s+(?:file|directory):\s*(.+)', "file_edit"),
-            (r'(?:Run|Execute)\s+command:\s*(.+)', "command_exec"),
-            (r'(?:Install|Add)\s+(?:package|dependency):\s*(.+)', "package_install"),
-        ]
-        
-        for pattern, action_type in permission_patterns:
-            match = re.search(pattern, line, re.IGNORECASE)
-            if match:
-                return {
-                    "action_type": action_type,
-                    "details": {
-                        "description": line,
-                        "target": match.group(1).strip()
-                    }
-                }
-        
-        # Generic permission request detection (fallback)
-        permission_keywords = ["approve", "confirm", "allow", "permit", "trust", "authorize"]
-        if any(keyword in line.lower() for keyword in permission_keywords):
-            # Check if it looks like a question
-            if "?" in line or line.strip().endswith(":"):
-                return {
-                    "action_type": "generic",
-                    "details": {
-                        "description": line.strip()
-                    }
-                }
-        
-        return None
-    
-    async def _handle_permission_request(self, request: Dict[str, Any]) -> bool:
-        """
-        Handle a permission request by calling the callback.
-        
-        Args:
-            request: Permission request details
-            
-        Returns:
-            True if approved, False if denied
-        """
-        if not self.permission_callback:
-            logger.warning("No permission callback set, auto-denying request")
-            return False
-        
-        try:
-            request_id = str(uuid.uuid4())
-            logger.info(f"Processing permission request {request_id}: {request['action_type']}")
-            
-            # Call the permission callback
-            approved = await self.permission_callback(
-                request["action_type"],
-                request["details"]
-            )
-            
-            logger.info(f"Permission request {request_id} {'approved' if approved else 'denied'}")
-            return approved
-        
-        except Exception as e:
-            logger.error(f"Error handling permission request: {e}", exc_info=True)
-            return False
+        logger.warning("Unknown prompt type, denying: %.100s", prompt_text)
+        return _RESPONSE_NO
     
     def set_permission_callback(self, callback: Callable) -> None:
         """
@@ -10,6 +10,9 @@ from pathlib import Path
 from typing import List, Tuple, Optional, Dict
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
+# How long (seconds) a passed is_safe_directory check is trusted by navigation
+_VALIDATION_TTL = 10.0
+
 
 class DirectoryBrowser:
     """Handles directory navigation and inline keyboard generation."""
@@ -37,6 +40,10 @@ class DirectoryBrowser:
         self._path_registry: Dict[str, Tuple[str, float]] = {}  # {id: (path, timestamp)}
         self._reverse_registry: Dict[str, str] = {}  # {path: id}
         
+        # Paths that passed is_safe_directory, so navigation callbacks can skip
+        # re-checking them for a short while
+        self._validated_paths: Dict[str, float] = {}  # {path: timestamp}
+        
         # Default allowed directories
         if allowed_base_dirs is None:
             allowed_base_dirs = [
@@ -111,11 +118,30 @@ class DirectoryBrowser:
             if not os.access(resolved_path, os.W_OK):
                 return False, "No write permission (needed to create workspace)"
             
+            self._validated_paths[path] = time.monotonic()
             return True, ""
             
         except Exception as e:
             return False, f"Error checking directory: {str(e)}"
     
+    def is_validated(self, path: str) -> bool:
+        """
+        Check if a path passed is_safe_directory recently.
+        
+        Args:
+            path: Directory path to check
+            
+        Returns:
+            True if the path was validated within the last _VALIDATION_TTL seconds
+        """
+        validated_at = self._validated_paths.get(path)
+        if validated_at is None:
+            return False
+        if time.monotonic() - validated_at > _VALIDATION_TTL:
+            del self._validated_paths[path]
+            return False
+        return True
+    
     def list_directories(self, path: str, page: int = 0) -> Tuple[List[Path], bool, bool]:
         """
         List subdirectories in a path with pagination.
@@ -128,28 +154,52 @@ class DirectoryBrowser:
             Tuple of (directories, has_prev_page, has_next_page)
         """
         try:
-            resolved_path = Path(path).resolve()
-            
-            # Get all subdirectories
-            all_dirs = sorted([
-                d for d in resolved_path.iterdir()
-                if d.is_dir() and not d.name.startswith('.')
-            ], key=lambda x: x.name.lower())
-            
-            # Paginate
-            start_idx = page * self.max_dirs_per_page
-            end_idx = start_idx + self.max_dirs_per_page
-            
-            page_dirs = all_dirs[start_idx:end_idx]
-            has_prev = page > 0
-            has_next = end_idx < len(all_dirs)
-            
-            return page_dirs, has_prev, has_next
-            
-        except PermissionError:
-            return [], False, False
+            all_dirs = self._scan_directories(Path(path).resolve())
         except Exception:
             return [], False, False
+        
+        return self._paginate(all_dirs, page)
+    
+    def _scan_directories(self, resolved_path: Path) -> List[Path]:
+        """
+        Get all visible subdirectories of a path, sorted by name.
+        
+        Args:
+            resolved_path: Resolved directory path to scan
+            
+        Returns:
+            List of subdirectory paths
+        """
+        # scandir reports entry types from the directory listing itself,
+        # avoiding a stat() per entry on most filesystems
+        with os.scandir(resolved_path) as entries:
+            return sorted(
+                (
+                    Path(entry.path) for entry in entries
+                    if entry.is_dir() and not entry.name.startswith('.')
+                ),
+                key=lambda x: x.name.lower()
+            )
+    
+    def _paginate(self, all_dirs: List[Path], page: int) -> Tuple[List[Path], bool, bool]:
+        """
+        Slice one page out of a directory listing.
+        
+        Args:
+            all_dirs: Full sorted directory listing
+            page: Page number (0-indexed)
+            
+        Returns:
+            Tuple of (directories, has_prev_page, has_next_page)
+        """
+        start_idx = page * self.max_dirs_per_page
+        end_idx = start_idx + self.max_dirs_per_page
+        
+        page_dirs = all_dirs[start_idx:end_idx]
+        has_prev = page > 0
+        has_next = end_idx < len(all_dirs)
+        
+        return page_dirs, has_prev, has_next
     
     def get_parent_directory(self, path: str) -> Optional[str]:
         """
@@ -226,6 +276,7 @@ class DirectoryBrowser:
             del self._path_registry[path_id]
             if old_path in self._reverse_registry:
                 del self._reverse_registry[old_path]
+            self._validated_paths.pop(old_path, None)
         
         # Limit registry size
         if len(self._path_registry) > 1000:
@@ -238,6 +289,7 @@ class DirectoryBrowser:
                 del self._path_registry[path_id]
                 if old_path in self._reverse_registry:
                     del self._reverse_registry[old_path]
+                self._validated_paths.pop(old_path, None)
         
         # Check if path already registered
         if path in self._reverse_registry:
@@ -306,10 +358,31 @@ class DirectoryBrowser:
         Returns:
             InlineKeyboardMarkup for Telegram
         """
-        keyboard = []
-        
-        # Get directories
         directories, has_prev, has_next = self.list_directories(current_path, page)
+        return self._build_keyboard(current_path, page, directories, has_prev, has_next)
+    
+    def _build_keyboard(
+        self,
+        current_path: str,
+        page: int,
+        directories: List[Path],
+        has_prev: bool,
+        has_next: bool
+    ) -> InlineKeyboardMarkup:
+        """
+        Build the navigation keyboard for one page of a directory listing.
+        
+        Args:
+            current_path: Current directory path
+            page: Current page number
+            directories: Subdirectories shown on this page
+            has_prev: Whether a previous page exists
+            has_next: Whether a next page exists
+            
+        Returns:
+            InlineKeyboardMarkup for Telegram
+        """
+        keyboard = []
         
         # Add directory buttons (2 per row)
         for i in range(0, len(directories), 2):
@@ -403,26 +476,59 @@ class DirectoryBrowser:
         """
         try:
             resolved_path = Path(path).resolve()
-            
-            # Count subdirectories
-            subdirs = sum(1 for d in resolved_path.iterdir() if d.is_dir() and not d.name.startswith('.'))
-            
-            # Check permissions
-            can_read = os.access(resolved_path, os.R_OK)
-            can_write = os.access(resolved_path, os.W_OK)
-            
-            permissions = []
-            if can_read:
-                permissions.append("Read")
-            if can_write:
-                permissions.append("Write")
-            
-            info = f"📂 **Current Directory**\n\n"
-            info += f"Path: `{self.format_directory_path(str(resolved_path), 60)}`\n"
-            info += f"Subdirectories: {subdirs}\n"
-            info += f"Permissions: {', '.join(permissions) if permissions else 'None'}\n"
-            
-            return info
+            subdirs = len(self._scan_directories(resolved_path))
+            return self._format_info(resolved_path, subdirs)
             
         except Exception as e:
             return f"Error getting directory info: {str(e)}"
+    
+    def get_directory_view(self, path: str, page: int = 0) -> Tuple[str, InlineKeyboardMarkup]:
+        """
+        Get directory info and navigation keyboard from a single directory scan.
+        
+        Args:
+            path: Directory path
+            page: Current page number
+            
+        Returns:
+            Tuple of (formatted info string, InlineKeyboardMarkup)
+        """
+        try:
+            resolved_path = Path(path).resolve()
+            all_dirs = self._scan_directories(resolved_path)
+            info = self._format_info(resolved_path, len(all_dirs))
+        except Exception as e:
+            return (
+                f"Error getting directory info: {str(e)}",
+                self._build_keyboard(path, page, [], False, False)
+            )
+        
+        return info, self._build_keyboard(path, page, *self._paginate(all_dirs, page))
+    
+    def _format_info(self, resolved_path: Path, subdirs: int) -> str:
+        """
+        Format directory information.
+        
+        Args:
+            resolved_path: Resolved directory path
+            subdirs: Number of visible subdirectories
+            
+        Returns:
+            Formatted info string
+        """
+        # Check permissions
+        can_read = os.access(resolved_path, os.R_OK)
+        can_write = os.access(resolved_path, os.W_OK)
+        
+        permissions = []
+        if can_read:
+            permissions.append("Read")
+        if can_write:
+            permissions.append("Write")
+        
+        info = f"📂 **Current Directory**\n\n"
+        info += f"Path: `{self.format_directory_path(str(resolved_path), 60)}`\n"
+        info += f"Subdirectories: {subdirs}\n"
+        info += f"Permissions: {', '.join(permissions) if permissions else 'None'}\n"
+        
+        return info
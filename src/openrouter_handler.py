@@ -3,9 +3,10 @@ OpenRouter API Handler for AgenticGram.
 Provides fallback AI capabilities when Claude Code is unavailable.
 """
 
+import asyncio
 import aiohttp
 import logging
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any
 
 
 logger = logging.getLogger(__name__)
@@ -66,10 +67,10 @@ class OpenRouterHandler:
                     logger.info("OpenRouter API is available")
                     return True
                 else:
-                    logger.warning(f"OpenRouter API check failed: {response.status}")
+                    logger.warning("OpenRouter API check failed: %s", response.status)
                     return False
         except Exception as e:
-            logger.error(f"Error checking OpenRouter availability: {e}")
+            logger.error("Error checking OpenRouter availability: %s", e)
             return False
     
     async def execute_instruction(
@@ -104,7 +105,7 @@ class OpenRouterHandler:
         
         for current_model in models_to_try:
             try:
-                logger.info(f"Trying OpenRouter model: {current_model}")
+                logger.info("Trying OpenRouter model: %s", current_model)
                 result = await self._call_api(
                     instruction=instruction,
                     model=current_model,
@@ -116,11 +117,11 @@ class OpenRouterHandler:
                 if result["success"]:
                     return result
                 else:
-                    logger.warning(f"Model {current_model} failed: {result.get('error')}")
+                    logger.warning("Model %s failed: %s", current_model, result.get('error'))
                     continue
             
             except Exception as e:
-                logger.error(f"Error with model {current_model}: {e}")
+                logger.error("Error with model %s: %s", current_model, e)
                 continue
         
         return {
@@ -184,8 +185,8 @@ class OpenRouterHandler:
                     
                     # Log usage for cost tracking
                     usage = data.get("usage", {})
-                    logger.info(f"OpenRouter usage - Model: {model}, "
-                              f"Tokens: {usage.get('total_tokens', 'unknown')}")
+                    logger.info("OpenRouter usage - Model: %s, Tokens: %s",
+                                model, usage.get('total_tokens', 'unknown'))
                     
                     return {
                         "success": True,
@@ -195,7 +196,7 @@ class OpenRouterHandler:
                     }
                 else:
                     error_text = await response.text()
-                    logger.error(f"OpenRouter API error {response.status}: {error_text}")
+                    logger.error("OpenRouter API error %s: %s", response.status, error_text)
                     return {
                         "success": False,
                         "output": "",
@@ -210,7 +211,7 @@ class OpenRouterHandler:
                 "error": "Request timed out"
             }
         except Exception as e:
-            logger.error(f"OpenRouter API call failed: {e}", exc_info=True)
+            logger.error("OpenRouter API call failed: %s", e, exc_info=True)
             return {
                 "success": False,
                 "output": "",
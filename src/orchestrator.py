@@ -3,14 +3,16 @@ Orchestrator for AgenticGram.
 Manages command routing between Claude Code and OpenRouter.
 """
 
+import asyncio
 import logging
+import time
 import uuid
-from typing import Dict, Any, Optional, Callable
+from typing import Dict, Any, Optional, Callable, Awaitable, Tuple
 from datetime import datetime
 
 from .claude_handler import ClaudeHandler
 from .openrouter_handler import OpenRouterHandler
-from .session_manager import SessionManager, PermissionRequest
+from .session_manager import SessionManager
 
 
 logger = logging.getLogger(__name__)
@@ -19,6 +21,9 @@ logger = logging.getLogger(__name__)
 class Orchestrator:
     """Orchestrates command execution across different AI backends."""
     
+    # Seconds a backend availability probe result is reused
+    AVAILABILITY_TTL = 10.0
+    
     def __init__(
         self,
         session_manager: SessionManager,
@@ -38,6 +43,11 @@ class Orchestrator:
         self.openrouter_handler = OpenRouterHandler(openrouter_api_key) if openrouter_api_key else None
         self.permission_callback: Optional[Callable] = None
         
+        # Cached availability probe results ({backend: (timestamp, available)})
+        # and the probes currently in flight, shared by concurrent callers
+        self._availability: Dict[str, Tuple[float, bool]] = {}
+        self._availability_tasks: Dict[str, asyncio.Task] = {}
+        
         # Set up Claude handler permission callback
         self.claude_handler.set_permission_callback(self._permission_callback_wrapper)
     
@@ -48,7 +58,7 @@ class Orchestrator:
         Returns:
             True if available, False otherwise
         """
-        return await self.claude_handler.check_availability()
+        return await self._cached_availability("claude", self.claude_handler.check_availability)
     
     async def check_openrouter_availability(self) -> bool:
         """
@@ -59,7 +69,71 @@ class Orchestrator:
         """
         if not self.openrouter_handler:
             return False
-        return await self.openrouter_handler.check_availability()
+        return await self._cached_availability("openrouter", self.openrouter_handler.check_availability)
+    
+    async def _cached_availability(self, backend: str, probe: Callable[[], Awaitable[bool]]) -> bool:
+        """
+        Run an availability probe, reusing a result younger than AVAILABILITY_TTL.
+        
+        Args:
+            backend: Backend name used as cache key
+            probe: Coroutine function performing the actual check
+            
+        Returns:
+            True if available, False otherwise
+        """
+        cached = self._availability.get(backend)
+        if cached and time.monotonic() - cached[0] < self.AVAILABILITY_TTL:
+            return cached[1]
+        
+        task = self._availability_tasks.get(backend)
+        if task is None:
+            task = asyncio.create_task(self._run_availability_probe(backend, probe))
+            self._availability_tasks[backend] = task
+        
+        # Shield the shared probe so one caller's cancellation doesn't abort it for others
+        return await asyncio.shield(task)
+    
+    async def _run_availability_probe(self, backend: str, probe: Callable[[], Awaitable[bool]]) -> bool:
+        """Run a probe and cache its result."""
+        try:
+            available = await probe()
+            self._availability[backend] = (time.monotonic(), available)
+            return available
+        finally:
+            self._availability_tasks.pop(backend, None)
+    
+    def availability_is_fresh(self) -> bool:
+        """
+        Check whether every configured backend has a cached availability result.
+        
+        Returns:
+            True if check_all_availability would answer without probing
+        """
+        backends = ("claude", "openrouter") if self.openrouter_handler else ("claude",)
+        now = time.monotonic()
+        return all(
+            backend in self._availability
+            and now - self._availability[backend][0] < self.AVAILABILITY_TTL
+            for backend in backends
+        )
+    
+    async def check_all_availability(self) -> Dict[str, bool]:
+        """
+        Check all backends concurrently.
+        
+        Returns:
+            Dictionary mapping backend name ('claude', 'openrouter') to availability
+        """
+        claude_available, openrouter_available = await asyncio.gather(
+            self.check_claude_availability(),
+            self.check_openrouter_availability(),
+            return_exceptions=True
+        )
+        return {
+            "claude": claude_available is True,
+            "openrouter": openrouter_available is True
+        }
     
     def set_permission_callback(self, callback: Callable) -> None:
         """
@@ -96,7 +170,7 @@ class Orchestrator:
             approved = await self.permission_callback(action_type, details)
             return approved
         except Exception as e:
-            logger.error(f"Error in permission callback: {e}", exc_info=True)
+            logger.error("Error in permission callback: %s", e, exc_info=True)
             return False
     
     async def execute_command(
@@ -114,23 +188,22 @@ class Orchestrator:
             instruction: The instruction to execute
             telegram_id: Telegram user ID
             chat_id: Telegram chat ID for permission requests
-            output_callback: Optional callback for streaming output updates
+            output_callback: Optional callback for streaming output updates, called with
+                             (new finished output, current partial line)
             force_openrouter: Force use of OpenRouter instead of Claude
             
         Returns:
             Dictionary with execution result
         """
         # Get or create session
-        session = self.session_manager.get_session(telegram_id)
-        if not session:
-            session = self.session_manager.create_session(telegram_id)
+        session = self.session_manager.get_or_create_session(telegram_id)
         
         # Update session usage
         session.last_used = datetime.now()
         session.message_count += 1
         self.session_manager.update_session(session)
         
-        logger.info(f"Executing command for user {telegram_id}, session {session.session_id}")
+        logger.info("Executing command for user %s, session %s", telegram_id, session.session_id)
         
         # Try Claude Code first (unless forced to use OpenRouter)
         if not force_openrouter:
@@ -140,7 +213,7 @@ class Orchestrator:
                 logger.info("Using Claude Code CLI")
                 result = await self.claude_handler.execute_command(
                     instruction=instruction,
-                    work_dir=session.work_dir,
+                    work_dir=str(session.work_dir),
                     output_callback=output_callback
                 )
                 
@@ -3,24 +3,265 @@ PTY Handler for AgenticGram
 Manages pseudo-terminal execution for capturing interactive CLI programs.
 """
 
+import codecs
+import errno
 import os
 import pty
-import select
 import subprocess
 import asyncio
 import re
 import time
 import logging
-from typing import Callable, Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# Short escape sequence cut off at the end of a read, still waiting for its final byte
+_PARTIAL_ESCAPE_RE = re.compile(
+    r'(?:\x1B\[|\x9B)[0-?]*[ -/]*\Z'  # CSI awaiting its final byte
+    r'|\x1B\Z'                        # Lone ESC
+)
+
+# How far back from the end of a read a partial CSI sequence is looked for
+_MAX_ESCAPE_TAIL = 256
+
+# Openers of string sequences (OSC, DCS, PM, APC), which run until BEL (OSC
+# only) or ST and can be long, e.g. OSC 8 hyperlinks carrying a URL
+_OSC_STARTS = ('\x1b]', '\x9d')
+_STRING_SEQUENCE_STARTS = _OSC_STARTS + ('\x1bP', '\x1bX', '\x1b^', '\x1b_')
+
+# Claude Code header box, removed once its bottom border arrives
+_HEADER_START = "╭─── Claude Code"
+_HEADER_RE = re.compile(r'╭─── Claude Code.*?╰[─\s]*╯\s*', re.DOTALL)
+
+# TUI artifacts removed from the output
+_BORDER_LINE_RE = re.compile(r'^\s*│\s*$', re.MULTILINE)
+_BLOB_MARKER_RE = re.compile(r'\[\d+B blob data\]')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+# Numbered menu lines, such as "❯ 1. Yes" or "   2. No"
+_MENU_OPTION_RE = re.compile(r'^\s*[❯\s]*\s*(\d+)\.\s+(.+?)\s*$')
+_NUMBERED_LINE_RE = re.compile(r'^\s*\d+\.\s+')
+
+# Seconds between exit checks while the PTY stays open (e.g. held by a
+# background child); output and EOF wake the read loop immediately
+_EXIT_POLL_INTERVAL = 1.0
+
+# Bytes read from the PTY at a time, and the most reads done per wakeup so a
+# flood of output can't keep the event loop from other work
+_READ_SIZE = 64 * 1024
+_MAX_READS_PER_WAKEUP = 16
+
+# Amount of trailing output inspected when looking for a prompt
+_PROMPT_TAIL_CHARS = 512
+
+# C1 control characters, which the ANSI regex also strips
+_C1_CONTROL_RE = re.compile('[\x80-\x9f]')
+
+# Characters of blank and border-only lines
+_BLANK_CHARS = " \t\r\n\x0b\x0c│"
+
+# Default cap on the clean output kept per command
+_MAX_OUTPUT_CHARS = 4_000_000
+
+# Longest stretch of text held back while waiting for a line or header to complete
+_MAX_PENDING = 8192
+
+
+def _split_partial_escape(text: str) -> Tuple[str, str]:
+    """
+    Split off an escape sequence left incomplete at the end of a read.
+    
+    Args:
+        text: Raw text from the PTY
+        
+    Returns:
+        Tuple of (text safe to strip now, tail to prepend to the next read)
+    """
+    # An unterminated string sequence may start anywhere in the read; hold it
+    # back (up to _MAX_PENDING) until its terminator arrives
+    start = max(text.rfind(opener) for opener in _STRING_SEQUENCE_STARTS)
+    if start != -1 and len(text) - start <= _MAX_PENDING:
+        body = text[start + 1:]
+        terminated = '\x1b\\' in body or (
+            text.startswith(_OSC_STARTS, start) and '\x07' in body
+        )
+        if not terminated:
+            return text[:start], text[start:]
+    
+    match = _PARTIAL_ESCAPE_RE.search(text, max(0, len(text) - _MAX_ESCAPE_TAIL))
+    if match is None:
+        return text, ""
+    return text[:match.start()], text[match.start():]
+
+
+class _CleanOutput:
+    """
+    Incrementally cleaned PTY output.
+    
+    Each read is stripped of ANSI codes and TUI artifacts once, rather than
+    re-cleaning the whole accumulated buffer after every read. A trailing
+    partial line (or an unfinished header box) is held back until it
+    completes, so patterns never match half a line. Only about the last
+    handler.max_output_chars characters are kept.
+    """
+    
+    def __init__(self, handler: "PTYHandler"):
+        """
+        Initialize the output.
+        
+        Args:
+            handler: PTYHandler providing the ANSI regex and TUI cleanup
+        """
+        self._handler = handler
+        self._escape_tail = ""  # Raw text ending in an incomplete escape sequence
+        self._pending = ""  # ANSI-stripped text awaiting TUI cleanup
+        self._chunks: List[str] = []
+        self._size = 0  # Characters held in _chunks
+        self._dropped = 0  # Characters discarded to stay within the cap
+        self._committed = 0  # Characters of finished output over the whole command
+        self._trailing_newlines = 0
+        self._text: Optional[str] = ""
+    
+    @property
+    def committed(self) -> int:
+        """Total characters of finished output so far, for use with text_since."""
+        return self._committed
+    
+    @property
+    def partial(self) -> str:
+        """Cleaned text of the held-back partial line, which may still change."""
+        return self._clean(self._pending) if self._pending else ""
+    
+    @property
+    def text(self) -> str:
+        """Clean output so far, including the held-back partial line."""
+        if self._text is None:
+            joined = "".join(self._chunks)
+            self._chunks = [joined] if joined else []
+            if self._pending:
+                joined += self._clean(self._pending)
+            if self._dropped:
+                joined = f"...[truncated {self._dropped} chars]...\n" + joined
+            self._text = joined
+        return self._text
+    
+    def text_since(self, position: int) -> str:
+        """
+        Get the finished output added after an earlier position.
+        
+        Args:
+            position: Earlier value of committed
+            
+        Returns:
+            The new finished output (only what is still kept, if it was cleared or trimmed)
+        """
+        wanted = self._committed - position
+        parts = []
+        for chunk in reversed(self._chunks):
+            if wanted <= 0:
+                break
+            parts.append(chunk[-wanted:])
+            wanted -= len(chunk)
+        return "".join(reversed(parts))
+    
+    def feed(self, text: str) -> None:
+        """
+        Add newly read text.
+        
+        Args:
+            text: Decoded text from the PTY, possibly containing ANSI codes
+        """
+        text, self._escape_tail = _split_partial_escape(self._escape_tail + text)
+        pending = self._pending + self._handler._remove_escapes(text)
+        cut = self._hold_back_index(pending)
+        self._pending = pending[cut:]
+        self._commit(pending[:cut])
+        self._text = None
+    
+    def flush(self) -> None:
+        """Clean everything held back, once no more output will arrive."""
+        pending = self._pending + self._handler._remove_escapes(self._escape_tail)
+        self._escape_tail = self._pending = ""
+        self._commit(pending)
+        self._text = None
+    
+    def clear(self) -> None:
+        """Discard the output so far (e.g. after answering a prompt)."""
+        self._pending = ""
+        self._chunks = []
+        self._size = self._dropped = 0
+        self._trailing_newlines = 0
+        self._text = ""
+    
+    def _hold_back_index(self, pending: str) -> int:
+        """Find where the text whose cleanup may depend on later output starts."""
+        # Hold back the partial last line and any blank or border-only lines
+        # before it, as the TUI patterns swallow surrounding whitespace
+        line_start = pending.rfind('\n') + 1
+        body_end = len(pending[:line_start].rstrip(_BLANK_CHARS))
+        cut = pending.find('\n', body_end) + 1 if body_end else 0
+        
+        # Hold the whole header box until its bottom border (and the
+        # whitespace after it) has been followed by other text
+        header = pending.rfind(_HEADER_START, 0, cut)
+        if header != -1:
+            match = _HEADER_RE.match(pending, header)
+            if match is None or match.end() > cut or match.end() == len(pending):
+                cut = header
+        
+        if len(pending) - cut > _MAX_PENDING:
+            return len(pending)
+        return cut
+    
+    def _clean(self, text: str) -> str:
+        """Remove TUI artifacts, collapsing blank lines across the chunk boundary."""
+        cleaned = self._handler._clean_tui_artifacts(text)
+        if self._trailing_newlines:
+            leading = len(cleaned) - len(cleaned.lstrip('\n'))
+            keep = 2 - self._trailing_newlines
+            if leading > keep:
+                cleaned = cleaned[leading - keep:]
+        return cleaned
+    
+    def _commit(self, text: str) -> None:
+        """Clean text that can no longer change and append it."""
+        if not text:
+            return
+        cleaned = self._clean(text)
+        if not cleaned:
+            return
+        self._chunks.append(cleaned)
+        self._size += len(cleaned)
+        self._committed += len(cleaned)
+        
+        # Trim with some slack, so the copy is amortized over many reads
+        limit = self._handler.max_output_chars
+        if self._size > limit + limit // 4:
+            joined = "".join(self._chunks)
+            excess = len(joined) - limit
+            self._chunks = [joined[excess:]]
+            self._size = limit
+            self._dropped += excess
+        body = cleaned.rstrip('\n')
+        trailing = len(cleaned) - len(body)
+        if not body:
+            trailing += self._trailing_newlines
+        self._trailing_newlines = min(trailing, 2)
+
 
 class PTYHandler:
     """Handles PTY-based subprocess execution with ANSI parsing and interactive prompts."""
     
-    def __init__(self):
-        """Initialize PTY handler."""
+    def __init__(self, max_output_chars: int = _MAX_OUTPUT_CHARS):
+        """
+        Initialize PTY handler.
+        
+        Args:
+            max_output_chars: Most recent output kept per command; older output is dropped
+        """
+        self.max_output_chars = max_output_chars
+        
         # Regex to match ANSI escape codes
         # Regex to match ANSI escape codes including OSC sequences
         # Matches:
@@ -46,6 +287,7 @@ class PTYHandler:
             "[Y/n]",
             "[y/N]",
         ]
+        self._prompt_indicator_re = re.compile('|'.join(map(re.escape, self.prompt_indicators)))
         
         # Animation patterns (loading spinners, progress indicators)
         self.animation_patterns = [
@@ -54,6 +296,7 @@ class PTYHandler:
             r'\(ctrl\+o to expand\)',  # UI hints
             r'ought for\d+s\)',  # Timing info
         ]
+        self._animation_re = re.compile('|'.join(f'(?:{p})' for p in self.animation_patterns))
     
     def strip_ansi(self, text: str) -> str:
         """
@@ -66,11 +309,27 @@ class PTYHandler:
             Clean text without ANSI codes or TUI artifacts
         """
         # First strip ANSI codes
-        text = self.ansi_escape.sub('', text)
+        text = self._remove_escapes(text)
         
         # Then clean TUI artifacts
         return self._clean_tui_artifacts(text)
     
+    def _remove_escapes(self, text: str) -> str:
+        """
+        Remove ANSI escape codes, skipping the regex for text without any.
+        
+        Args:
+            text: Text potentially containing ANSI codes
+            
+        Returns:
+            Text without ANSI codes
+        """
+        # Plain output is common; substring and ASCII checks are much
+        # cheaper than running the escape regex over it
+        if '\x1b' not in text and (text.isascii() or not _C1_CONTROL_RE.search(text)):
+            return text
+        return self.ansi_escape.sub('', text)
+    
     def _clean_tui_artifacts(self, text: str) -> str:
         """
         Remove TUI artifacts like borders, headers, etc.
@@ -84,19 +343,25 @@ class PTYHandler:
         if not text:
             return ""
             
+        # Each pattern is skipped when a literal it requires is absent
+        
         # Remove Claude Code header box (╭─── Claude Code ... ╰───...╯)
         # Matches top border, content, and bottom border
-        text = re.sub(r'╭─── Claude Code.*?╰[─\s]*╯\s*', '', text, flags=re.DOTALL)
+        if _HEADER_START in text:
+            text = _HEADER_RE.sub('', text)
         
         # Remove standalone TUI lines that are just borders
         # Matches lines that are just │ or vertical bars with whitespace
-        text = re.sub(r'^\s*│\s*$', '', text, flags=re.MULTILINE)
+        if '│' in text:
+            text = _BORDER_LINE_RE.sub('', text)
         
         # Remove "blob data" markers from logs if they leaked into output
-        text = re.sub(r'\[\d+B blob data\]', '', text)
+        if 'B blob data]' in text:
+            text = _BLOB_MARKER_RE.sub('', text)
         
         # Remove multiple empty lines specifically caused by TUI cleanup
-        text = re.sub(r'\n{3,}', '\n\n', text)
+        if '\n\n\n' in text:
+            text = _BLANK_LINES_RE.sub('\n\n', text)
         
         return text
     
@@ -113,19 +378,9 @@ class PTYHandler:
         if not text or len(text.strip()) < 3:
             return True
         
-        # Check for animation patterns
-        for pattern in self.animation_patterns:
-            if re.search(pattern, text):
-                return True
-        
-        # Check if mostly special characters (animation)
-        clean = re.sub(r'[\s\n\r]', '', text)
-        if len(clean) > 0:
-            special_chars = len(re.findall(r'[✻✶*✢·●✽⠂⠐⠁⠈⠄⠠]', clean))
-            if special_chars / len(clean) > 0.5:  # More than 50% animation chars
-                return True
-        
-        return False
+        # Check for animation patterns. The spinner pattern matches any single
+        # animation character, so this also covers text made mostly of them
+        return self._animation_re.search(text) is not None
     
     def _extract_menu_options(self, text: str) -> Optional[list]:
         """
@@ -141,8 +396,12 @@ class PTYHandler:
         options = []
         
         for line in lines:
+            # Options need a "N." marker; skip the regex for lines without a dot
+            if '.' not in line:
+                continue
+            
             # Match patterns like "❯ 1. Yes" or "   2. No"
-            match = re.match(r'^\s*[❯\s]*\s*(\d+)\.\s+(.+?)\s*$', line)
+            match = _MENU_OPTION_RE.match(line)
             if match:
                 number = match.group(1)
                 text = match.group(2).strip()
@@ -172,16 +431,16 @@ class PTYHandler:
             return False
         
         # Check for prompt indicators
-        for indicator in self.prompt_indicators:
-            if indicator in text:
-                return True
+        if self._prompt_indicator_re.search(text):
+            return True
         
         # Check for numbered menu options (1., 2., etc.)
         lines = text.strip().split('\n')
         if len(lines) >= 2:
             # Look for pattern like "1. Option" and "2. Option"
+            # (the substring check is a cheap prefilter before the regex)
             has_numbered_options = any(
-                re.match(r'^\s*\d+\.\s+', line) for line in lines[-3:]
+                '.' in line and _NUMBERED_LINE_RE.match(line) for line in lines[-3:]
             )
             if has_numbered_options:
                 return True
@@ -193,7 +452,7 @@ class PTYHandler:
         command: List[str],
         cwd: str,
         prompt_callback: Optional[Callable[[str], Any]] = None,
-        output_callback: Optional[Callable[[str], Any]] = None,
+        output_callback: Optional[Callable[[str, str], Any]] = None,
         timeout: int = 1800
     ) -> Dict[str, Any]:
         """
@@ -203,7 +462,10 @@ class PTYHandler:
             command: Command and arguments to execute
             cwd: Working directory
             prompt_callback: Async callback for handling prompts, receives clean prompt text
-            output_callback: Async callback for streaming output
+                             and returns the response to write (bytes or str)
+            output_callback: Async callback for streaming output, receives the finished
+                             output added since its last call and the current
+                             unfinished line (which may still change)
             timeout: Command timeout in seconds
             
         Returns:
@@ -211,11 +473,13 @@ class PTYHandler:
         """
         master_fd = None
         process = None
+        output = _CleanOutput(self)
+        loop = asyncio.get_running_loop()
         
         try:
             # Create PTY
             master_fd, slave_fd = pty.openpty()
-            logger.info(f"Created PTY for command: {' '.join(command)}")
+            logger.info("Created PTY for command: %s", ' '.join(command))
             
             # Start process with PTY
             process = subprocess.Popen(
@@ -225,124 +489,174 @@ class PTYHandler:
                 stderr=slave_fd,
                 cwd=cwd,
                 close_fds=True,
-                preexec_fn=os.setsid  # Create new session
+                start_new_session=True  # setsid() in the child, without a Python preexec_fn
             )
             
             # Parent doesn't need slave fd
             os.close(slave_fd)
             
-            logger.info(f"Started process PID {process.pid} in PTY")
+            logger.info("Started process PID %s in PTY", process.pid)
+            
+            # Read output whenever the event loop reports the PTY readable
+            os.set_blocking(master_fd, False)
+            output_ready = asyncio.Event()
             
-            # Read loop
-            output_buffer = ""
-            clean_output = ""
+            # Reads land in one reusable buffer; the incremental decoder keeps
+            # multi-byte characters split across reads intact
+            read_buffer = bytearray(_READ_SIZE)
+            read_view = memoryview(read_buffer)
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
             last_output_time = time.time()
+            prompt_checked = False  # Output unchanged since the last prompt check
+            stream_pending = False  # Output changed since the last stream update
+            pty_closed = False
             last_callback_time = 0
             CALLBACK_INTERVAL = 0.5  # Stream updates every 0.5 seconds
+            sent_position = 0  # Finished output already passed to output_callback
+            
+            def on_readable() -> None:
+                nonlocal last_output_time, prompt_checked, stream_pending, pty_closed
+                # Drain whatever is buffered so a burst is cleaned in one batch;
+                # a short read means the PTY is empty for now
+                chunks = []
+                closed = False
+                try:
+                    for _ in range(_MAX_READS_PER_WAKEUP):
+                        size = os.readv(master_fd, [read_buffer])
+                        if not size:
+                            closed = True
+                            break
+                        chunks.append(decoder.decode(read_view[:size]))
+                        if size < _READ_SIZE:
+                            break
+                except BlockingIOError:
+                    pass
+                except OSError as e:
+                    # Linux reports EIO once the child side of the PTY is closed
+                    if e.errno != errno.EIO:
+                        logger.error("Error reading from PTY: %s", e)
+                    closed = True
+                
+                if chunks:
+                    # Decode and clean just the new data
+                    output.feed("".join(chunks))
+                    last_output_time = time.time()
+                    prompt_checked = False
+                    stream_pending = True
+                if closed:
+                    logger.debug("EOF reached on PTY")
+                    pty_closed = True
+                    loop.remove_reader(master_fd)
+                if chunks or closed:
+                    output_ready.set()
             
+            loop.add_reader(master_fd, on_readable)
             start_time = time.time()
             
             while True:
                 # Check timeout
                 if time.time() - start_time > timeout:
-                    logger.warning(f"Command timed out after {timeout} seconds")
+                    logger.warning("Command timed out after %s seconds", timeout)
                     process.kill()
                     return {
                         "success": False,
-                        "output": clean_output,
+                        "output": output.text,
                         "error": f"Timed out after {timeout} seconds"
                     }
                 
                 # Check if process finished
                 if process.poll() is not None:
-                    logger.info(f"Process finished with return code {process.returncode}")
+                    logger.info("Process finished with return code %s", process.returncode)
+                    break
+                if pty_closed:
                     break
                 
-                # Non-blocking read with timeout
-                ready, _, _ = select.select([master_fd], [], [], 0.1)
-                
-                if ready:
-                    try:
-                        data = os.read(master_fd, 4096)
-                        if not data:
-                            logger.debug("EOF reached on PTY")
-                            break
-                        
-                        # Decode data
-                        text = data.decode('utf-8', errors='replace')
-                        output_buffer += text
-                        
-                        # Strip ANSI codes for clean text
-                        clean_text = self.strip_ansi(output_buffer)
-                        clean_output = clean_text
-                        
-                        last_output_time = time.time()
-                        
-                        # Log output (show actual text, not blob)
-                        logger.info(f"PTY output ({len(clean_text)} chars): {clean_text[:200]}")
-                        
-                    except OSError as e:
-                        logger.error(f"Error reading from PTY: {e}")
-                        break
-                
-                # Check for prompts (only if we have a callback)
-                if prompt_callback:
+                # Check for prompts (only if we have a callback and new output)
+                if prompt_callback and not prompt_checked:
                     idle_time = time.time() - last_output_time
                     
-                    if self._is_prompt(clean_output, idle_time):
-                        logger.info(f"Detected interactive prompt: {clean_output[-200:]}")
-                        
-                        # Call prompt callback
-                        try:
-                            response = await prompt_callback(clean_output)
+                    # Prompts are only considered once output has paused, so
+                    # don't build the output text while it is still streaming.
+                    # A prompt sits at the end, so only the tail is inspected.
+                    if idle_time >= 1.0:
+                        prompt_checked = True
+                        if self._is_prompt(output.text[-_PROMPT_TAIL_CHARS:], idle_time):
+                            logger.info("Detected interactive prompt: %s", output.text[-200:])
                             
-                            if response:
-                                logger.info(f"Sending response to prompt: {response.strip()}")
-                                os.write(master_fd, response.encode())
+                            # Stop reading while waiting for the answer, so output
+                            # arriving meanwhile isn't discarded with the prompt
+                            loop.remove_reader(master_fd)
+                            try:
+                                response = await prompt_callback(output.text)
                                 
-                                # Clear buffer after responding
-                                output_buffer = ""
-                                clean_output = ""
-                                last_output_time = time.time()
-                        except Exception as e:
-                            logger.error(f"Error in prompt callback: {e}", exc_info=True)
+                                if response:
+                                    if isinstance(response, str):
+                                        response = response.encode()
+                                    logger.info("Sending response to prompt: %r", response.strip())
+                                    os.write(master_fd, response)
+                                    
+                                    # Clear output after responding
+                                    output.clear()
+                                    last_output_time = time.time()
+                            except Exception as e:
+                                logger.error("Error in prompt callback: %s", e, exc_info=True)
+                            finally:
+                                loop.add_reader(master_fd, on_readable)
                 
                 # Stream output callback (skip animation frames)
-                if output_callback and clean_output:
+                if output_callback and stream_pending:
                     current_time = time.time()
                     if current_time - last_callback_time >= CALLBACK_INTERVAL:
-                        # Only send if it's not just an animation frame
-                        if not self._is_animation_frame(clean_output):
+                        stream_pending = False
+                        position = output.committed
+                        delta = output.text_since(sent_position)
+                        partial = output.partial
+                        # Only send if it's not just an animation frame; a
+                        # skipped delta is sent along with the next update
+                        if not self._is_animation_frame(delta + partial):
                             try:
-                                await output_callback(clean_output)
+                                await output_callback(delta, partial)
+                                sent_position = position
                                 last_callback_time = current_time
                             except Exception as e:
-                                logger.error(f"Error in output callback: {e}")
+                                logger.error("Error in output callback: %s", e)
                         else:
                             logger.debug("Skipping animation frame")
                 
-                # Small sleep to avoid busy waiting
-                await asyncio.sleep(0.05)
+                # Sleep until new output arrives or a prompt check, stream
+                # update, exit poll or the timeout is due
+                now = time.time()
+                wait = min(_EXIT_POLL_INTERVAL, start_time + timeout - now)
+                if prompt_callback and not prompt_checked:
+                    wait = min(wait, last_output_time + 1.0 - now)
+                if output_callback and stream_pending:
+                    wait = min(wait, last_callback_time + CALLBACK_INTERVAL - now)
+                try:
+                    await asyncio.wait_for(output_ready.wait(), max(wait, 0))
+                except asyncio.TimeoutError:
+                    pass
+                output_ready.clear()
             
             # Read any remaining output
+            loop.remove_reader(master_fd)
             try:
                 while True:
-                    ready, _, _ = select.select([master_fd], [], [], 0.1)
-                    if not ready:
+                    size = os.readv(master_fd, [read_buffer])
+                    if not size:
                         break
-                    data = os.read(master_fd, 4096)
-                    if not data:
-                        break
-                    text = data.decode('utf-8', errors='replace')
-                    output_buffer += text
-                    clean_output = self.strip_ansi(output_buffer)
-            except:
+                    output.feed(decoder.decode(read_view[:size]))
+            except OSError:
                 pass
             
+            output.feed(decoder.decode(b"", final=True))
+            output.flush()
+            clean_output = output.text
+            
             # Final output callback
-            if output_callback and clean_output:
+            delta = output.text_since(sent_position)
+            if output_callback and delta:
                 try:
-                    await output_callback(clean_output)
+                    await output_callback(delta, "")
                 except:
                     pass
             
@@ -351,8 +665,8 @@ class PTYHandler:
             success = (returncode == 0)
             
             # Log final output
-            logger.info(f"Command finished with return code {returncode}")
-            logger.info(f"Final output ({len(clean_output)} chars): {clean_output[:500]}")
+            logger.info("Command finished with return code %s", returncode)
+            logger.info("Final output (%d chars): %.500s", len(clean_output), clean_output)
             
             # If failed, include output in error field
             if not success:
@@ -370,10 +684,10 @@ class PTYHandler:
             }
             
         except Exception as e:
-            logger.error(f"Error in PTY execution: {e}", exc_info=True)
+            logger.error("Error in PTY execution: %s", e, exc_info=True)
             return {
                 "success": False,
-                "output": clean_output if 'clean_output' in locals() else "",
+                "output": output.text,
                 "error": str(e)
             }
             
@@ -381,6 +695,7 @@ class PTYHandler:
             # Cleanup
             if master_fd is not None:
                 try:
+                    loop.remove_reader(master_fd)
                     os.close(master_fd)
                 except:
                     pass
@@ -6,6 +6,7 @@ Handles session persistence, working directories, and permission history.
 import sqlite3
 import json
 import logging
+import uuid
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Dict, List
@@ -20,7 +21,7 @@ class Session:
     """Represents a user session."""
     telegram_id: int
     session_id: str
-    work_dir: str
+    work_dir: Path
     created_at: datetime
     last_used: datetime
     message_count: int = 0
@@ -28,6 +29,7 @@ class Session:
     def to_dict(self) -> dict:
         """Convert session to dictionary."""
         data = asdict(self)
+        data['work_dir'] = str(self.work_dir)
         data['created_at'] = self.created_at.isoformat()
         data['last_used'] = self.last_used.isoformat()
         return data
@@ -59,6 +61,8 @@ class SessionManager:
         self.db_path = db_path
         self.work_dir_base = Path(work_dir_base)
         self.work_dir_base.mkdir(parents=True, exist_ok=True)
+        # Write-through cache of sessions by telegram_id; the DB stays the source of truth
+        self._sessions: Dict[int, Session] = {}
         self._init_database()
     
     def _init_database(self) -> None:
@@ -104,8 +108,6 @@ class SessionManager:
         Returns:
             New Session object
         """
-        import uuid
-        
         # Generate a valid UUID for Claude Code CLI --session-id
         session_id = str(uuid.uuid4())
         work_dir = self.work_dir_base / f"user_{telegram_id}" / session_id
@@ -115,7 +117,7 @@ class SessionManager:
         session = Session(
             telegram_id=telegram_id,
             session_id=session_id,
-            work_dir=str(work_dir),
+            work_dir=work_dir,
             created_at=now,
             last_used=now
         )
@@ -129,14 +131,15 @@ class SessionManager:
             """, (
                 session.telegram_id,
                 session.session_id,
-                session.work_dir,
+                str(session.work_dir),
                 session.created_at.isoformat(),
                 session.last_used.isoformat(),
                 session.message_count
             ))
             conn.commit()
         
-        logger.info(f"Created new session {session_id} for user {telegram_id}")
+        self._sessions[telegram_id] = session
+        logger.info("Created new session %s for user %s", session_id, telegram_id)
         return session
     
     def set_work_directory(self, telegram_id: int, custom_path: str) -> Optional[Session]:
@@ -153,17 +156,14 @@ class SessionManager:
         # Validate the directory exists and is accessible
         custom_dir = Path(custom_path).resolve()
         if not custom_dir.exists():
-            logger.error(f"Custom directory does not exist: {custom_path}")
+            logger.error("Custom directory does not exist: %s", custom_path)
             return None
         
         if not custom_dir.is_dir():
-            logger.error(f"Path is not a directory: {custom_path}")
+            logger.error("Path is not a directory: %s", custom_path)
             return None
         
-        # Get or create session
-        session = self.get_session(telegram_id)
-        if not session:
-            session = self.create_session(telegram_id)
+        session = self.get_or_create_session(telegram_id)
         
         # Create workspace subdirectory in custom path
         workspace = custom_dir / f"agenticgram_{telegram_id}"
@@ -171,14 +171,14 @@ class SessionManager:
         try:
             workspace.mkdir(parents=True, exist_ok=True)
         except PermissionError:
-            logger.error(f"Permission denied creating workspace in: {custom_path}")
+            logger.error("Permission denied creating workspace in: %s", custom_path)
             return None
         except Exception as e:
-            logger.error(f"Error creating workspace directory: {e}")
+            logger.error("Error creating workspace directory: %s", e)
             return None
         
         # Update session with new work directory
-        session.work_dir = str(workspace)
+        session.work_dir = workspace
         session.last_used = datetime.now()
         
         with sqlite3.connect(self.db_path) as conn:
@@ -188,13 +188,14 @@ class SessionManager:
                 SET work_dir = ?, last_used = ?
                 WHERE telegram_id = ?
             """, (
-                session.work_dir,
+                str(session.work_dir),
                 session.last_used.isoformat(),
                 telegram_id
             ))
             conn.commit()
         
-        logger.info(f"Set custom work directory for user {telegram_id}: {workspace}")
+        self._sessions[telegram_id] = session
+        logger.info("Set custom work directory for user %s: %s", telegram_id, workspace)
         return session
     
     def get_session(self, telegram_id: int) -> Optional[Session]:
@@ -207,6 +208,10 @@ class SessionManager:
         Returns:
             Session object if exists, None otherwise
         """
+        session = self._sessions.get(telegram_id)
+        if session is not None:
+            return session
+        
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             cursor.execute("""
@@ -216,17 +221,34 @@ class SessionManager:
             
             row = cursor.fetchone()
             if row:
-                return Session(
+                session = Session(
                     telegram_id=row[0],
                     session_id=row[1],
-                    work_dir=row[2],
+                    work_dir=Path(row[2]),
                     created_at=datetime.fromisoformat(row[3]),
                     last_used=datetime.fromisoformat(row[4]),
                     message_count=row[5]
                 )
+                self._sessions[telegram_id] = session
+                return session
         
         return None
     
+    def get_or_create_session(self, telegram_id: int) -> Session:
+        """
+        Get a user's session, creating one if none exists.
+        
+        This is synchronous, so callers on the event loop can't interleave
+        between the lookup and the creation and end up with two sessions.
+        
+        Args:
+            telegram_id: Telegram user ID
+            
+        Returns:
+            Existing or new Session object
+        """
+        return self.get_session(telegram_id) or self.create_session(telegram_id)
+    
     def update_session(self, session: Session) -> None:
         """
         Update session in database.
@@ -242,12 +264,14 @@ class SessionManager:
                 WHERE telegram_id = ?
             """, (
                 session.session_id,
-                session.work_dir,
+                str(session.work_dir),
                 session.last_used.isoformat(),
                 session.message_count,
                 session.telegram_id
             ))
             conn.commit()
+        
+        self._sessions[session.telegram_id] = session
     
     def delete_session(self, telegram_id: int) -> bool:
         """
@@ -269,7 +293,8 @@ class SessionManager:
             cursor.execute("DELETE FROM permissions WHERE session_id = ?", (session.session_id,))
             conn.commit()
         
-        logger.info(f"Deleted session for user {telegram_id}")
+        self._sessions.pop(telegram_id, None)
+        logger.info("Deleted session for user %s", telegram_id)
         return True
     
     def log_permission_request(self, request: PermissionRequest) -> None:
@@ -373,5 +398,5 @@ class SessionManager:
             for (telegram_id,) in old_sessions:
                 self.delete_session(telegram_id)
         
-        logger.info(f"Cleaned up {count} old sessions")
+        logger.info("Cleaned up %s old sessions", count)
         return count
@@ -5,8 +5,9 @@ Provides helper functions for validation, formatting, and logging.
 
 import os
 import logging
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, List
+from typing import Optional, List, Callable, Any
 from dotenv import load_dotenv
 
 
@@ -27,7 +28,8 @@ def setup_logging(log_level: str = "INFO", log_file: Optional[str] = None) -> No
     logging.basicConfig(
         level=getattr(logging, log_level.upper()),
         format=log_format,
-        handlers=handlers
+        handlers=handlers,
+        force=True
     )
 
 
@@ -76,19 +78,23 @@ def load_environment() -> dict:
     return env_vars
 
 
+# File extensions accepted for uploads by default
+ALLOWED_FILE_EXTENSIONS = frozenset({'.py', '.sql', '.js', '.txt', '.json', '.md'})
+
+
 def validate_file_type(filename: str, allowed_extensions: List[str] = None) -> bool:
     """
     Validate if a file has an allowed extension.
     
     Args:
         filename: Name of the file to validate
-        allowed_extensions: List of allowed extensions (default: ['.py', '.sql', '.js'])
+        allowed_extensions: Allowed extensions (default: ALLOWED_FILE_EXTENSIONS)
         
     Returns:
         True if file type is allowed, False otherwise
     """
     if allowed_extensions is None:
-        allowed_extensions = ['.py', '.sql', '.js', '.txt', '.json', '.md']
+        allowed_extensions = ALLOWED_FILE_EXTENSIONS
     
     file_ext = Path(filename).suffix.lower()
     return file_ext in allowed_extensions
@@ -174,3 +180,44 @@ def escape_markdown(text: str) -> str:
     # We escape them with a backslash
     escape_chars = '_*`['
     return ''.join(f'\\{c}' if c in escape_chars else c for c in text)
+
+
+class LRUCache(OrderedDict):
+    """
+    Dictionary holding at most ``maxsize`` entries.
+    
+    Reads and writes mark an entry as most recently used; inserting past
+    capacity evicts the least recently used entry.
+    """
+    
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        on_evict: Optional[Callable[[Any, Any], None]] = None
+    ):
+        """
+        Initialize the cache.
+        
+        Args:
+            maxsize: Maximum number of entries to keep
+            on_evict: Optional callback receiving (key, value) of evicted entries
+        """
+        super().__init__()
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+    
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+    
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+    
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            evicted_key, evicted_value = self.popitem(last=False)
+            if self.on_evict:
+                self.on_evict(evicted_key, evicted_value)
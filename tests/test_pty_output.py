@@ -0,0 +1,72 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.pty_handler import PTYHandler, _CleanOutput
+
+
+SAMPLE = (
+    "\x1b]0;claude\x07\x1b[?25l"
+    "╭─── Claude Code v2.1.29 ───────────────────╮\n"
+    "│ Welcome back!                            │\n"
+    "╰───────────────────────────────────────────╯\n"
+    "\x1b[1mReading\x1b[0m files...\n"
+    "│\n"
+    "\n\n\n"
+    "[128B blob data]Done \x1b[32m✔\x1b[0m\n"
+    "Apply changes? (y/n)"
+)
+
+
+class TestCleanOutput(unittest.TestCase):
+    def feed_in_chunks(self, text, size):
+        output = _CleanOutput(PTYHandler())
+        for i in range(0, len(text), size):
+            output.feed(text[i:i + size])
+        return output
+
+    def test_matches_whole_buffer_cleaning(self):
+        expected = PTYHandler().strip_ansi(SAMPLE)
+        for size in (1, 2, 3, 7, 16, len(SAMPLE)):
+            output = self.feed_in_chunks(SAMPLE, size)
+            output.flush()
+            self.assertEqual(output.text, expected, f"chunk size {size}")
+
+    def test_partial_line_visible_before_flush(self):
+        output = self.feed_in_chunks(SAMPLE, 5)
+        self.assertTrue(output.text.endswith("Apply changes? (y/n)"))
+
+    def test_split_escape_is_not_leaked(self):
+        output = _CleanOutput(PTYHandler())
+        output.feed("Hello \x1b[3")
+        self.assertEqual(output.text, "Hello ")
+        output.feed("1mWorld\x1b[0m")
+        self.assertEqual(output.text, "Hello World")
+
+    def test_long_osc_split_across_reads_is_not_leaked(self):
+        text = ("before \x1b]8;;https://example.com/" + "a" * 400
+                + "\x1b\\link\x1b]8;;\x1b\\ after\n")
+        output = self.feed_in_chunks(text, 100)
+        output.flush()
+        self.assertEqual(output.text, PTYHandler().strip_ansi(text))
+        self.assertEqual(output.text, "before link after\n")
+
+    def test_clear_discards_output(self):
+        output = self.feed_in_chunks(SAMPLE, 4)
+        output.clear()
+        output.feed("Next\n")
+        self.assertEqual(output.text, "Next\n")
+
+    def test_output_is_capped(self):
+        output = _CleanOutput(PTYHandler(max_output_chars=100))
+        for i in range(1000):
+            output.feed(f"line {i}\n")
+        self.assertTrue(output.text.startswith("...[truncated "))
+        self.assertTrue(output.text.endswith("line 999\n"))
+        self.assertLess(len(output.text), 200)
+
+
+if __name__ == "__main__":
+    unittest.main()